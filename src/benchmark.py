@@ -0,0 +1,288 @@
+"""
+Time the tools against throwaway git repositories of different sizes, and compare the times with a baseline.
+
+Each repository is built with `git fast-import` (a chain of commits, files, and version tags), and editorconfig-checker is replaced with a command that does nothing (so only the tools are timed).
+
+:usage: `python3 benchmark.py --help`.
+"""
+
+import argparse, os, stat, subprocess, sys, tempfile, time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import eclint, files, git_session, gitignore, make_changelog, test_gitignore, test_tags, version
+
+# The number of tags, commits, tracked files, and untracked files in each size of repository
+_SIZES = {
+	"small": {"tags": 100, "commits": 200, "files": 200, "untracked": 20},
+	"medium": {"tags": 2000, "commits": 2000, "files": 2000, "untracked": 200},
+	"large": {"tags": 20000, "commits": 10000, "files": 10000, "untracked": 1000},
+}
+_DEFAULT_SIZES = ["small", "medium"]
+# Files per folder (names must be kept by the default gitignore file)
+_FOLDER_SIZE = 100
+_AUTHOR = "Benchmark <benchmark@example.com>"
+_EPOCH = 1500000000
+# Differences smaller than this (in seconds) are never regressions
+_MIN_DIFFERENCE = 0.005
+
+def _data(text: str) -> bytes:
+	"""
+	Return a data command for `git fast-import`.
+
+	:param text: The data.
+	:return: The command.
+	"""
+	data = text.encode()
+	return f"data {len(data)}\n".encode() + data + b"\n"
+
+def _get_path(index: int) -> str:
+	"""
+	Return the path of a tracked file.
+
+	:param index: The number of the file.
+	:return: The path.
+	"""
+	return f"src/folder{index // _FOLDER_SIZE}x/file{index}x.md"
+
+def _get_stream(tags: int, commits: int, file_count: int, lightweight: bool, gitignore_text: str) -> Iterable[bytes]:
+	"""
+	Return the commands for `git fast-import` that build the repository.
+
+	:param tags: The number of version tags (spread evenly over the commits).
+	:param commits: The number of commits (the first adds every file, and each one after it changes one file).
+	:param file_count: The number of files.
+	:param lightweight: Make lightweight tags instead of annotated tags.
+	:param gitignore_text: The contents of the gitignore file.
+	:return: The commands.
+	"""
+	for commit in range(commits):
+		yield f"commit refs/heads/main\nmark :{commit + 1}\ncommitter {_AUTHOR} {_EPOCH + commit} +0000\n".encode() + _data(f"Change {commit}")
+
+		if commit == 0:
+			yield b"M 100644 inline .gitignore\n" + _data(gitignore_text)
+			yield b"M 100644 inline .editorconfig\n" + _data("root = true\n")
+
+			for index in range(file_count):
+				yield f"M 100644 inline {_get_path(index)}\n".encode() + _data(f"# File {index}\n")
+		elif file_count:
+			index = commit % file_count
+			yield f"M 100644 inline {_get_path(index)}\n".encode() + _data(f"# File {index}\n\nChange {commit}\n")
+
+		yield b"\n"
+
+	for tag in range(tags):
+		name = f"v1.{tag // 1000}.{tag % 1000}"
+		# Spread tags evenly up to the last commit (commits have several tags if there are more tags than commits)
+		mark = max((tag + 1) * commits // tags, 1)
+
+		if lightweight:
+			yield f"reset refs/tags/{name}\nfrom :{mark}\n\n".encode()
+		else:
+			yield f"tag {name}\nfrom :{mark}\ntagger {_AUTHOR} {_EPOCH + mark} +0000\n".encode() + _data(f"Release {name}\n\nChanges up to commit {mark}.")
+
+def _make_repo(path: str, tags: int, commits: int, file_count: int, untracked: int, lightweight: bool, gitignore_text: str) -> None:
+	"""
+	Build a repository, check out its main branch, and change to its directory.
+
+	:param path: The path of the repository.
+	:param tags: The number of version tags.
+	:param commits: The number of commits (at least 1).
+	:param file_count: The number of tracked files.
+	:param untracked: The number of untracked files (that are not ignored).
+	:param lightweight: Make lightweight tags instead of annotated tags.
+	:param gitignore_text: The contents of the gitignore file.
+	:raise subprocess.CalledProcessError: A git command failed.
+	"""
+	git_session.run(["init", "--quiet", path])
+	os.chdir(path)
+	process = git_session.popen(["fast-import", "--quiet"], stdin = subprocess.PIPE)
+
+	try:
+		for chunk in _get_stream(tags, commits, file_count, lightweight, gitignore_text):
+			process.stdin.write(chunk)
+	finally:
+		process.stdin.close()
+
+	if process.wait() != 0:
+		raise subprocess.CalledProcessError(process.returncode, process.args)
+
+	git_session.run(["symbolic-ref", "HEAD", "refs/heads/main"])
+	git_session.run(["reset", "--quiet", "--hard"])
+
+	for index in range(untracked):
+		files.write_if_changed(os.path.join("untracked", f"folder{index // _FOLDER_SIZE}x", f"file{index}x.md"), f"# Untracked file {index}\n".encode())
+
+def _make_checker(directory: str) -> None:
+	"""
+	Make an editorconfig-checker command that does nothing.
+
+	:param directory: The directory to put the command in (add this to the start of `PATH`).
+	"""
+	path = os.path.join(directory, eclint._COMMAND[0])
+
+	with open(path, "w") as f:
+		f.write("#!/bin/sh\nexit 0\n")
+
+	os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC | stat.S_IXGRP | stat.S_IXOTH)
+
+def _lint() -> None:
+	"""Lint every file (forget which files passed before)."""
+	eclint.clear_cache()
+	eclint.run_eclint()
+
+def _get_benchmarks(directory: str, gitignore_text: str) -> Dict[str, Callable[[], object]]:
+	"""
+	Return the functions to time.
+
+	:param directory: A directory outside the repository to write changelogs to.
+	:param gitignore_text: The contents of the gitignore file.
+	:return: The functions (by name).
+	"""
+	return {
+		"version": lambda: version.get_version(prefix = "v", semver = True, refresh = True),
+		"version-cached": lambda: version.get_version(prefix = "v", semver = True),
+		"changelog": lambda: make_changelog.make_changelog(prefix = "v", file_name = os.path.join(directory, "CHANGELOG.md")),
+		"test-tags": lambda: test_tags.test_tags(prefix = "v", semver = True, no_metadata = True),
+		"eclint": _lint,
+		"gitignore": lambda: files.write_if_changed(".gitignore", gitignore.get_text(gitignore.combine_settings({})).encode()),
+		"test-gitignore": test_gitignore.test_gitignore,
+	}
+
+def _benchmark_size(settings: Dict[str, Any], repeat: int, only: Optional[List[str]]) -> Dict[str, Dict[str, float]]:
+	"""
+	Build a repository, and time each function in it.
+
+	:param settings: The size of the repository (`tags`, `commits`, `files`, `untracked`, and `lightweight`).
+	:param repeat: Time each function this many times (the fastest time is kept).
+	:param only: Only time the functions with these names (all of them by default).
+	:return: The fastest time (`seconds`), and the number of git processes started in the fastest run (`git_processes`), of each function (by name).
+	:raise subprocess.CalledProcessError: A git command failed.
+	"""
+	directory = os.getcwd()
+	path = os.environ.get("PATH", "")
+	gitignore_text = gitignore.get_text(gitignore.combine_settings({}))
+	results = {}
+
+	with tempfile.TemporaryDirectory() as temp_directory:
+		try:
+			_make_checker(temp_directory)
+			os.environ["PATH"] = temp_directory + os.pathsep + path
+			_make_repo(os.path.join(temp_directory, "repo"), settings["tags"], max(settings["commits"], 1), settings["files"], settings["untracked"], settings["lightweight"], gitignore_text)
+
+			for name, function in _get_benchmarks(temp_directory, gitignore_text).items():
+				if only and name not in only:
+					continue
+
+				for _ in range(repeat):
+					# Forget facts learned by earlier runs
+					git_session.reset()
+					launch_count = git_session.get_launch_count()
+					start = time.perf_counter()
+					function()
+					seconds = time.perf_counter() - start
+
+					if name not in results or seconds < results[name]["seconds"]:
+						results[name] = {"seconds": seconds, "git_processes": git_session.get_launch_count() - launch_count}
+		finally:
+			os.environ["PATH"] = path
+			os.chdir(directory)
+			# Stop git processes in the repository before it is removed
+			git_session.reset()
+
+	return results
+
+def benchmark(sizes: Iterable[str] = _DEFAULT_SIZES, overrides: Optional[Dict[str, int]] = None, lightweight: bool = False, repeat: int = 3, only: Optional[List[str]] = None) -> Dict[str, Dict[str, Any]]:
+	"""
+	Time the tools against a throwaway repository of each size, and print the times.
+
+	:param sizes: The names of the sizes (see `_SIZES`).
+	:param overrides: Use these numbers of `tags`, `commits`, `files`, or `untracked` files for every size.
+	:param lightweight: Make lightweight tags instead of annotated tags (with messages).
+	:param repeat: Time each function this many times (the fastest time is kept).
+	:param only: Only time the functions with these names (all of them by default).
+	:return: The settings (`settings`), and the times (`results`, see `_benchmark_size`), for each size (by name).
+	:raise Exception: A size or function name is unknown, or a function failed.
+	:raise subprocess.CalledProcessError: A git command failed.
+	"""
+	sizes = list(sizes)
+	unknown = [size for size in sizes if size not in _SIZES] + [name for name in only or [] if name not in _get_benchmarks("", "")]
+
+	if unknown:
+		raise Exception(f"Unknown sizes or benchmarks ({', '.join(unknown)})")
+
+	report = {}
+
+	for size in sizes:
+		settings = {**_SIZES[size], **(overrides or {}), "lightweight": lightweight}
+		print(f"{size}: {', '.join(f'{key}: {value}' for key, value in settings.items())}")
+		results = _benchmark_size(settings, repeat, only)
+
+		for name, result in results.items():
+			print(f"{result['seconds']:8.3f}s {result['git_processes']:4} git processes  {name}")
+
+		report[size] = {"settings": settings, "results": results}
+
+	return report
+
+def compare(report: Dict[str, Dict[str, Any]], baseline: Dict[str, Dict[str, Any]], threshold: float = 0.2) -> None:
+	"""
+	Compare times with a baseline, and print the change in each.
+
+	:param report: The times (from `benchmark`).
+	:param baseline: The baseline times (from `benchmark`).
+	:param threshold: The largest allowed slowdown (as a fraction of the baseline time).
+	:raise Exception: A time is slower than the baseline by more than the threshold (every time is compared before this is raised).
+	"""
+	regressions = []
+
+	for size, current in report.items():
+		if size not in baseline:
+			print(f"Warning: {size} is not in the baseline", file = sys.stderr)
+			continue
+
+		if baseline[size]["settings"] != current["settings"]:
+			print(f"Warning: {size} was measured with different settings in the baseline", file = sys.stderr)
+
+		for name, result in current["results"].items():
+			old_result = baseline[size]["results"].get(name)
+
+			if old_result is None:
+				continue
+
+			old_seconds, seconds = old_result["seconds"], result["seconds"]
+			change = seconds / old_seconds - 1 if old_seconds else 0.0
+			regressed = change > threshold and seconds - old_seconds > _MIN_DIFFERENCE
+			print(f"{'✗' if regressed else '✓'} {size} {name}: {old_seconds:.3f}s -> {seconds:.3f}s ({change:+.0%})")
+
+			if regressed:
+				regressions.append(f"{size} {name} ({change:+.0%})")
+
+	if regressions:
+		raise Exception(f"Slower than the baseline by more than {threshold:.0%}: {', '.join(regressions)}")
+
+if __name__ == "__main__":
+	_PARSER = argparse.ArgumentParser()
+	_PARSER.add_argument("--size", action = "append", choices = list(_SIZES), default = None, help = "benchmark a repository of this size (repeat for several sizes, small and medium by default)")
+	_PARSER.add_argument("--tags", type = int, default = None, help = "the number of version tags (for every size)")
+	_PARSER.add_argument("--commits", type = int, default = None, help = "the number of commits (for every size)")
+	_PARSER.add_argument("--files", type = int, default = None, help = "the number of tracked files (for every size)")
+	_PARSER.add_argument("--untracked", type = int, default = None, help = "the number of untracked files (for every size)")
+	_PARSER.add_argument("--lightweight", action = "store_true", help = "make lightweight tags instead of annotated tags")
+	_PARSER.add_argument("--repeat", type = int, default = 3, help = "time each function this many times (and keep the fastest)")
+	_PARSER.add_argument("--only", action = "append", default = None, metavar = "NAME", help = "only time this function (repeat for several functions)")
+	_PARSER.add_argument("--output", default = None, metavar = "FILE", help = "write the times to FILE (to use as a baseline)")
+	_PARSER.add_argument("--compare", default = None, metavar = "FILE", help = "compare the times with the baseline in FILE (and fail if any are slower)")
+	_PARSER.add_argument("--threshold", type = float, default = 0.2, help = "the largest allowed slowdown compared to the baseline (as a fraction)")
+	_ARGS = _PARSER.parse_args()
+	_OVERRIDES = {key: getattr(_ARGS, key) for key in ["tags", "commits", "files", "untracked"] if getattr(_ARGS, key) is not None}
+	_REPORT = benchmark(sizes = _ARGS.size or _DEFAULT_SIZES, overrides = _OVERRIDES, lightweight = _ARGS.lightweight, repeat = _ARGS.repeat, only = _ARGS.only)
+
+	if _ARGS.output:
+		files.write_json(_ARGS.output, _REPORT)
+
+	if _ARGS.compare:
+		_BASELINE = files.read_json(_ARGS.compare)
+
+		if _BASELINE is None:
+			raise Exception(f"{_ARGS.compare} is not a baseline")
+
+		compare(_REPORT, _BASELINE, threshold = _ARGS.threshold)
\ No newline at end of file
@@ -1,7 +1,9 @@
 """Check various conditions."""
 
-import os, subprocess
+import os
+import git_session, tracing
 
+@tracing.phase("checks.assert_is_root")
 def assert_is_root() -> None:
 	"""
 	Ensure the current working directory is the root of a git repository.
@@ -9,8 +11,9 @@ def assert_is_root() -> None:
 	:raise AssertionError: The current working directory is not the root of a git repository.
 	:raise subprocess.CalledProcessError: Failed to get the root of the git repository.
 	"""
-	assert os.path.samefile(os.getcwd(), subprocess.run(["git", "rev-parse", "--show-toplevel"], capture_output = True, check = True, text = True).stdout.strip()), "You must run this from the root directory of the repository"
+	assert os.path.samefile(os.getcwd(), git_session.get_toplevel()), "You must run this from the root directory of the repository"
 
+@tracing.phase("checks.assert_branch_exists")
 def assert_branch_exists() -> None:
 	"""
 	Ensure any git branch exists.
@@ -18,4 +21,4 @@ def assert_branch_exists() -> None:
 	:raise AssertionError: No branches exist.
 	:raise subprocess.CalledProcessError: Failed to check for branches.
 	"""
-	assert subprocess.run(["git", "branch", "--list"], capture_output = True, check = True, text = True).stdout.strip(), "A branch must exist (make a commit)"
\ No newline at end of file
+	assert git_session.has_branch(), "A branch must exist (make a commit)"
\ No newline at end of file
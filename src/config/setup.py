@@ -4,8 +4,12 @@
 REQUIRED_COMMANDS = []
 # Create these directories
 REQUIRED_PATHS = []
-# Run these commands (use a list or tuple for each command)
+# Run these commands (use a list or tuple for each command to run it in order before the named commands)
+# Use a dictionary to name a command and list the commands it requires (named commands run at the same time once their requirements succeed, and their output is shown under their names)
+# For example, {"name": "generate", "command": ["python3", "generate.py"], "requires": ["download"]}
 COMMANDS = []
+# Run at most this many named commands at the same time (None uses the number of CPUs)
+JOBS = None
 
 def setup() -> None:
 	"""Run additional setup for the project."""
@@ -1,25 +1,265 @@
-"""Lint files not ignored by git against editorconfig."""
+"""
+Lint files not ignored by git against editorconfig.
 
-import subprocess
-import checks
+:usage: `python3 eclint.py --help`.
+"""
+
+import argparse, concurrent.futures, hashlib, os, sys
+from typing import Iterable, Iterator, List, Optional
+import checks, files, git_session, tracing
+
+_COMMAND = ["editorconfig-checker", "-ignore-defaults"]
+_CACHE_NAME = "eclint-cache.json"
+# The most files remembered as passing
+_CACHE_SIZE = 100000
+# Windows limits the length of a command line to 32767 characters
+_WINDOWS_MAX_LENGTH = 32767
+# The smallest argument limit POSIX allows (used if the system does not report one)
+_POSIX_MIN_ARG_MAX = 4096
+# Leave room for anything else counted against the argument limit
+_RESERVED_LENGTH = 4096
+# Each argument also takes a pointer (and a NUL byte) on POSIX systems
+_ARGUMENT_OVERHEAD = 9
+# Check a failed run again in this many parts to find files that pass (the parts that fail are split again on the next run)
+_RECHECK_PARTS = 4
+
+def _get_max_length() -> int:
+	"""
+	Return the maximum total length of the arguments for one command.
+
+	:return: The maximum length (in bytes). Commands still get one path each if the environment leaves no room.
+	"""
+	if os.name == "nt":
+		return _WINDOWS_MAX_LENGTH - _RESERVED_LENGTH
+
+	try:
+		limit = os.sysconf("SC_ARG_MAX")
+	except (AttributeError, ValueError, OSError):
+		limit = _POSIX_MIN_ARG_MAX
+
+	# The environment shares the limit with the arguments
+	environment_length = sum(len(os.fsencode(key)) + len(os.fsencode(value)) + 2 + _ARGUMENT_OVERHEAD for key, value in os.environ.items())
+	return max(limit - environment_length - _RESERVED_LENGTH, 0)
+
+def _make_commands(paths: Iterable[str], max_count: Optional[int] = None) -> Iterator[List[str]]:
+	"""
+	Split paths into as few editorconfig-checker commands as the argument limit allows.
+
+	:param paths: The paths to check.
+	:param max_count: Put at most this many paths in each command.
+	:return: The commands.
+	"""
+	max_length = _get_max_length()
+	base_length = sum(len(argument) + _ARGUMENT_OVERHEAD for argument in _COMMAND)
+	command = list(_COMMAND)
+	length = base_length
+
+	for path in paths:
+		path_length = len(path.encode()) + _ARGUMENT_OVERHEAD
+
+		if len(command) > len(_COMMAND) and (length + path_length > max_length or len(command) - len(_COMMAND) == max_count):
+			yield command
+			command = list(_COMMAND)
+			length = base_length
+
+		command.append(path)
+		length += path_length
+
+	if len(command) > len(_COMMAND):
+		yield command
+
+def _run_commands(commands: List[List[str]], jobs: int, capture_output: bool = False) -> List[bool]:
+	"""
+	Run editorconfig-checker commands, and print their output.
+
+	:param commands: The commands to run.
+	:param jobs: The number of commands to run at a time (output is captured, and printed in order, when this is more than 1).
+	:param capture_output: Capture the output of each command, and print it when the command finishes.
+	:return: Whether each command succeeded.
+	"""
+	if jobs <= 1 and not capture_output:
+		return [tracing.run(command, capture_output = False, check = False, text = True).returncode == 0 for command in commands]
+
+	results = []
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers = max(jobs, 1)) as executor:
+		for result in executor.map(lambda command: tracing.run(command, capture_output = True, check = False, text = True), commands):
+			sys.stdout.write(result.stdout)
+			sys.stderr.write(result.stderr)
+			results.append(result.returncode == 0)
+
+	return results
+
+def _find_passing(failed_paths: List[List[str]], jobs: int) -> List[str]:
+	"""
+	Return paths in failed editorconfig-checker runs that pass, by checking a few parts of each run again (without printing the output).
+
+	:param failed_paths: The paths of each failed run.
+	:param jobs: The number of commands to run at a time.
+	:return: The paths of the parts that pass (at most `_RECHECK_PARTS` commands are run for each failed run).
+	"""
+	parts = []
+
+	for paths in failed_paths:
+		if len(paths) > 1:
+			size = -(-len(paths) // _RECHECK_PARTS)
+			parts += [paths[index:index + size] for index in range(0, len(paths), size)]
+
+	passing = []
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers = max(jobs, 1)) as executor:
+		for part, result in zip(parts, executor.map(lambda part: tracing.run(_COMMAND + part, capture_output = True, check = False), parts)):
+			if result.returncode == 0:
+				passing += part
+
+	return passing
+
+def _list_paths(*args: str) -> List[str]:
+	"""
+	Return the paths listed by a git command that separates them with NUL bytes.
+
+	:param args: The git command's arguments.
+	:return: The paths.
+	:raise subprocess.CalledProcessError: The git command failed.
+	"""
+	return [path for path in git_session.run(list(args)).stdout.split("\0") if path]
+
+def _get_default_base() -> Optional[str]:
+	"""
+	Return the ref to compare against when none is given (the upstream branch, or origin's default branch).
+
+	:return: The ref, or `None` if neither exists.
+	"""
+	for ref in ["@{upstream}", "origin/HEAD"]:
+		if git_session.run(["rev-parse", "--verify", "--quiet", ref], check = False).returncode == 0:
+			return ref
+
+	return None
+
+def _get_changed_files(base: str) -> List[str]:
+	"""
+	Return the files added or modified between a ref (from where it diverged) and HEAD.
+
+	:param base: The ref.
+	:return: The files (that still exist).
+	:raise subprocess.CalledProcessError: Failed to compare the ref and HEAD.
+	"""
+	return [path for path in _list_paths("diff", "--name-only", "-z", "--no-renames", "--diff-filter=ACMT", f"{base}...HEAD", "--") if os.path.isfile(path)]
+
+def clear_cache() -> None:
+	"""
+	Forget which files passed (the cache is also ignored after the editorconfig file changes).
+
+	:raise subprocess.CalledProcessError: Failed to get the git directory.
+	"""
+	path = git_session.get_git_path(_CACHE_NAME)
+
+	if os.path.isfile(path):
+		os.remove(path)
+
+def _get_keys(paths: List[str]) -> List[Optional[str]]:
+	"""
+	Return the cache keys of files (their paths and git blob hashes).
+
+	:param paths: The paths of the files.
+	:return: The key of each file (`None` if the path cannot be hashed in a batch).
+	:raise subprocess.CalledProcessError: Failed to hash the files.
+	"""
+	# Paths are given to git one per line
+	hashable_paths = [path for path in paths if "\n" not in path]
+
+	if not hashable_paths:
+		return [None] * len(paths)
+
+	hashes = git_session.run(["hash-object", "--stdin-paths"], input = "\n".join(hashable_paths) + "\n").stdout.split()
+	keys = {path: f"{blob} {path}" for path, blob in zip(hashable_paths, hashes)}
+	return [keys.get(path) for path in paths]
+
+def _get_editorconfig_hash() -> str:
+	"""
+	Return the hash of the editorconfig file.
+
+	:return: The hash (empty if there is no editorconfig file).
+	"""
+	try:
+		with open(".editorconfig", "rb") as f:
+			return hashlib.sha256(f.read()).hexdigest()
+	except FileNotFoundError:
+		return ""
 
 # Uses https://github.com/editorconfig-checker/editorconfig-checker
-def run_eclint() -> None:
+@tracing.phase("eclint.run_eclint")
+def run_eclint(jobs: int = 1, changed_since: Optional[str] = None, use_cache: bool = True, capture_output: bool = False) -> None:
 	"""
 	Ensure all files not ignored by git respect editorconfig.
 
-	:raise subprocess.CalledProcessError: A file does not respect editorconfig.
+	:param jobs: The number of editorconfig-checker processes to run at a time.
+	:param changed_since: Only check untracked files, and files added or modified between this ref (from where it diverged from HEAD) and HEAD. Use an empty string for the upstream branch (or origin's default branch).
+	:param use_cache: Skip files that passed before with the same contents and editorconfig file (the cache is kept in the git directory). With the cache, tracked files (from `git ls-files --cached`) are passed to editorconfig-checker explicitly, like untracked files. Without it, editorconfig-checker finds tracked files itself. Parts of failed runs are checked again (up to `_RECHECK_PARTS` extra runs each) so the files that pass are remembered too.
+	:param capture_output: Capture editorconfig-checker's output, and print it after each run (so it is not mixed with output printed at the same time).
+	:raise Exception: A file does not respect editorconfig (every file is checked before this is raised).
+	:raise subprocess.CalledProcessError: Failed to get untracked or changed files.
 	:raise AssertionError: The current working directory is not the root of a git repository.
 	"""
 	checks.assert_is_root()
 
-	untracked_files = subprocess.run(["git", "ls-files", "--others", "--exclude-standard", "--full-name"], capture_output = True, check = True, text = True).stdout.split("\n")
-	untracked_files = [path.strip() for path in untracked_files if path.strip()]
+	if changed_since == "":
+		changed_since = _get_default_base()
+
+		if changed_since is None:
+			print("Warning: No upstream branch to compare against (checking all files)", file = sys.stderr)
+
+	untracked_files = _list_paths("ls-files", "-z", "--others", "--exclude-standard", "--full-name")
+	commands = []
+
+	if changed_since is not None:
+		paths = _get_changed_files(changed_since) + untracked_files
+	elif use_cache:
+		# List every file so files that passed before can be skipped
+		paths = [path for path in _list_paths("ls-files", "-z", "--cached", "--full-name") if os.path.isfile(path)] + untracked_files
+	else:
+		commands.append(list(_COMMAND))
+		paths = untracked_files
+
+	if use_cache:
+		cache_path = git_session.get_git_path(_CACHE_NAME)
+		editorconfig_hash = _get_editorconfig_hash()
+		cache = files.read_json(cache_path, {})
+		passed = cache.get("passed", {}) if cache.get("editorconfig") == editorconfig_hash else {}
+		keys = dict(zip(paths, _get_keys(paths)))
+
+		for key in keys.values():
+			# Move used keys to the end so the least recently used are removed first
+			if key in passed:
+				passed[key] = passed.pop(key)
+
+		paths = [path for path in paths if keys[path] not in passed]
+
+	# Give each job a share of the files
+	max_count = -(-len(paths) // jobs) if jobs > 1 else None
+	commands += list(_make_commands(paths, max_count))
+	results = _run_commands(commands, jobs, capture_output)
+
+	if use_cache:
+		passing = [path for command, succeeded in zip(commands, results) if succeeded for path in command[len(_COMMAND):]]
+		# Remember files that passed in failed runs too (each run narrows the files that are checked again)
+		passing += _find_passing([command[len(_COMMAND):] for command, succeeded in zip(commands, results) if not succeeded], jobs)
+		passed.update((keys[path], None) for path in passing if keys[path] is not None)
+
+		for key in list(passed)[:max(len(passed) - _CACHE_SIZE, 0)]:
+			del passed[key]
+
+		files.write_json(cache_path, {"editorconfig": editorconfig_hash, "passed": passed})
 
-	subprocess.run(["editorconfig-checker", "-ignore-defaults"], capture_output = False, check = True, text = True)
+	failures = results.count(False)
 
-	for path in untracked_files:
-		subprocess.run(["editorconfig-checker", "-ignore-defaults", path], capture_output = False, check = True, text = True)
+	if failures:
+		raise Exception(f"Files do not respect editorconfig ({failures} of {len(commands)} editorconfig-checker runs failed)")
 
 if __name__ == "__main__":
-	run_eclint()
\ No newline at end of file
+	_PARSER = argparse.ArgumentParser()
+	_PARSER.add_argument("--jobs", type = int, default = 1, help = "the number of checker processes to run at a time")
+	_PARSER.add_argument("--changed-since", nargs = "?", const = "", default = None, metavar = "REF", help = "only check untracked files and files changed since REF (the upstream branch by default)")
+	_PARSER.add_argument("--no-cache", dest = "use_cache", action = "store_false", help = "check files even if they passed before")
+	_ARGS = _PARSER.parse_args()
+	run_eclint(jobs = _ARGS.jobs, changed_since = _ARGS.changed_since, use_cache = _ARGS.use_cache)
\ No newline at end of file
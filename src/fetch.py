@@ -0,0 +1,111 @@
+"""
+Fetch tags from a remote, and prune the ones it deleted, unless they are already up to date.
+
+The remote's tags are listed with one `git ls-remote`, and only tags that are missing or moved are fetched (tags the remote deleted are deleted locally). Branches are not fetched.
+
+:usage: `python3 fetch.py --help`.
+"""
+
+import argparse, time
+from typing import Dict, List, Tuple
+import checks, files, git_session, tracing
+
+_STATE_NAME = "fetch-state.json"
+# Fetch every tag (instead of naming each one) when more than this many changed
+_MAX_REFSPECS = 1000
+
+def _read_remote_tags(remote: str) -> Dict[str, str]:
+	"""
+	Return the tags of a remote.
+
+	:param remote: The name of the remote.
+	:return: The object name of each tag (by ref).
+	:raise subprocess.CalledProcessError: Failed to list the tags (the remote could not be reached).
+	"""
+	tags = {}
+
+	for line in git_session.run(["ls-remote", "--tags", remote]).stdout.splitlines():
+		object_name, _, name = line.partition("\t")
+
+		# Skip the commits annotated tags point to (local tags point to the tag objects)
+		if name and not name.endswith("^{}"):
+			tags[name] = object_name
+
+	return tags
+
+def _read_local_tags() -> Dict[str, str]:
+	"""
+	Return the local tags.
+
+	:return: The object name of each tag (by ref).
+	:raise subprocess.CalledProcessError: Failed to list the tags.
+	"""
+	tags = {}
+
+	for line in git_session.run(["for-each-ref", "--format=%(objectname) %(refname)", "refs/tags/"]).stdout.splitlines():
+		object_name, _, name = line.partition(" ")
+		tags[name] = object_name
+
+	return tags
+
+def _get_changes(remote_tags: Dict[str, str], local_tags: Dict[str, str]) -> Tuple[List[str], List[str]]:
+	"""
+	Return the tags to fetch and the tags to delete.
+
+	:param remote_tags: The remote's tags (from `_read_remote_tags`).
+	:param local_tags: The local tags (from `_read_local_tags`).
+	:return: The tags that are missing or moved, and the local tags the remote does not have.
+	"""
+	fetched = sorted(name for name, object_name in remote_tags.items() if local_tags.get(name) != object_name)
+	deleted = sorted(name for name in local_tags if name not in remote_tags)
+	return fetched, deleted
+
+@tracing.phase("fetch.fetch")
+def fetch(remote: str = "origin", ttl: float = 0, force: bool = False) -> bool:
+	"""
+	Fetch the tags of a remote that are missing or moved, and delete the ones the remote deleted (like `git fetch --prune <remote> "+refs/tags/*:refs/tags/*"`).
+
+	:param remote: The name of the remote.
+	:param ttl: Skip checking the remote if it was checked less than this many seconds ago.
+	:param force: Check the remote even if it was checked less than `ttl` seconds ago.
+	:return: Whether any tags were fetched or deleted.
+	:raise subprocess.CalledProcessError: A git command failed.
+	:raise AssertionError: The current working directory is not the root of a git repository.
+	"""
+	checks.assert_is_root()
+
+	state_path = git_session.get_git_path(_STATE_NAME)
+	state = files.read_json(state_path, {})
+
+	if not force and state.get("remote") == remote and 0 <= time.time() - state.get("checked", 0) < ttl:
+		return False
+
+	local_tags = _read_local_tags()
+	fetched, deleted = _get_changes(_read_remote_tags(remote), local_tags)
+
+	if len(fetched) > _MAX_REFSPECS:
+		git_session.run(["fetch", "--prune", "--no-tags", remote, "+refs/tags/*:refs/tags/*"], capture_output = False)
+	else:
+		if fetched:
+			git_session.run(["fetch", "--no-tags", remote, *[f"+{name}:{name}" for name in fetched]], capture_output = False)
+
+		if deleted:
+			# Only delete tags that have not moved since they were listed
+			git_session.run(["update-ref", "--stdin"], input = "".join(f"delete {name} {local_tags[name]}\n" for name in deleted))
+
+	files.write_json(state_path, {"remote": remote, "checked": time.time()})
+
+	if fetched or deleted:
+		print(f"Fetched {len(fetched)} and deleted {len(deleted)} tags from {remote}")
+		git_session.reset()
+		return True
+
+	return False
+
+if __name__ == "__main__":
+	_PARSER = argparse.ArgumentParser()
+	_PARSER.add_argument("--remote", default = "origin", help = "the remote to fetch from")
+	_PARSER.add_argument("--ttl", type = float, default = 0, metavar = "SECONDS", help = "skip checking the remote if it was checked less than SECONDS ago")
+	_PARSER.add_argument("--force", action = "store_true", help = "check the remote even if it was checked recently")
+	_ARGS = _PARSER.parse_args()
+	fetch(remote = _ARGS.remote, ttl = _ARGS.ttl, force = _ARGS.force)
\ No newline at end of file
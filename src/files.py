@@ -0,0 +1,108 @@
+"""Read and write files."""
+
+import contextlib, hashlib, json, os, stat, tempfile
+from typing import Any, IO, Iterator, Optional
+
+def _get_mode(path: str) -> int:
+	"""
+	Return the permissions a new version of a file should have.
+
+	:param path: The path of the file.
+	:return: The permissions of the existing file, or the default permissions for new files.
+	"""
+	try:
+		return stat.S_IMODE(os.stat(path).st_mode)
+	except FileNotFoundError:
+		umask = os.umask(0)
+		os.umask(umask)
+		return 0o666 & ~umask
+
+@contextlib.contextmanager
+def open_atomically(path: str, binary: bool = False) -> Iterator[IO]:
+	"""
+	Open a temporary file to write, and replace the file at a path with it once writing succeeds.
+
+	:param path: The path of the file to replace.
+	:param binary: Open the file to write bytes (instead of UTF-8 text).
+	:return: The temporary file (as a context manager). The file at the path is not changed if an exception is raised.
+	"""
+	directory = os.path.dirname(os.path.abspath(path))
+	descriptor, temp_path = tempfile.mkstemp(prefix = f".{os.path.basename(path)}.", suffix = ".tmp", dir = directory)
+
+	try:
+		with os.fdopen(descriptor, "wb") if binary else os.fdopen(descriptor, "w", encoding = "utf-8") as f:
+			yield f
+
+		os.chmod(temp_path, _get_mode(path))
+		os.replace(temp_path, path)
+	except BaseException:
+		if os.path.exists(temp_path):
+			os.remove(temp_path)
+
+		raise
+
+def read_json(path: str, default: Any = None) -> Any:
+	"""
+	Return the data in a JSON file.
+
+	:param path: The path of the file.
+	:param default: Return this if the file is missing or invalid.
+	:return: The data.
+	"""
+	try:
+		with open(path, encoding = "utf-8") as f:
+			return json.load(f)
+	except (OSError, ValueError):
+		return default
+
+def write_json(path: str, data: Any) -> None:
+	"""
+	Write data to a JSON file atomically.
+
+	:param path: The path of the file.
+	:param data: The data.
+	"""
+	with open_atomically(path) as f:
+		json.dump(data, f, separators = (",", ":"))
+
+def is_changed(path: str, contents: bytes, executable: Optional[bool] = None) -> bool:
+	"""
+	Return whether writing contents to a file would change it.
+
+	:param path: The path of the file.
+	:param contents: The contents.
+	:param executable: Whether the file should be executable (`None` to ignore permissions).
+	:return: Whether the file is missing, or has different contents (compared by hash), or a different executable bit.
+	"""
+	try:
+		with open(path, "rb") as f:
+			if hashlib.sha256(f.read()).digest() != hashlib.sha256(contents).digest():
+				return True
+	except FileNotFoundError:
+		return True
+
+	return executable is not None and bool(os.stat(path).st_mode & stat.S_IXUSR) != executable
+
+def write_if_changed(path: str, contents: bytes, executable: Optional[bool] = None) -> bool:
+	"""
+	Write contents to a file atomically, unless the file already has them (to keep its modification time).
+
+	:param path: The path of the file (missing directories are created).
+	:param contents: The contents.
+	:param executable: Whether the file should be executable (`None` keeps the permissions of an existing file).
+	:return: Whether the file was written.
+	"""
+	if not is_changed(path, contents, executable):
+		return False
+
+	os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+
+	with open_atomically(path, binary = True) as f:
+		f.write(contents)
+
+	if executable is not None:
+		mode = stat.S_IMODE(os.stat(path).st_mode)
+		# Let everyone who can read the file execute it
+		os.chmod(path, mode | (mode & 0o444) >> 2 if executable else mode & ~0o111)
+
+	return True
\ No newline at end of file
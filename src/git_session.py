@@ -0,0 +1,307 @@
+"""
+Run git commands, remember facts about the repository, and keep git processes open for repeated queries.
+
+Set the `GIT_SESSION_COUNT` environment variable to print the number of git processes started when Python exits.
+"""
+
+import atexit, functools, os, re, subprocess, sys, threading
+from typing import Dict, List, Optional, Tuple
+import tracing
+
+_READ_SIZE = 65536
+_OBJECT_NAME_REGEX = re.compile(r"[0-9a-f]{40}|[0-9a-f]{64}")
+_LOCK = threading.RLock()
+_LAUNCH_COUNT = 0
+_CO_PROCESSES: Dict[Tuple[str, Tuple[str, ...]], "_CoProcess"] = {}
+
+def _count_launch() -> None:
+	"""Count a git process."""
+	global _LAUNCH_COUNT
+
+	with _LOCK:
+		_LAUNCH_COUNT += 1
+
+def get_launch_count() -> int:
+	"""
+	Return the number of git processes started.
+
+	:return: The number of processes.
+	"""
+	return _LAUNCH_COUNT
+
+def run(args: List[str], check: bool = True, input: Optional[str] = None, capture_output: bool = True) -> subprocess.CompletedProcess:
+	"""
+	Run a git command, and capture its output as text.
+
+	:param args: The arguments (without `git`).
+	:param check: Raise an exception if the command fails.
+	:param input: Send this to the command's standard input.
+	:param capture_output: Capture the output (instead of printing it).
+	:return: The completed process.
+	:raise subprocess.CalledProcessError: The command failed (if `check` is `True`).
+	"""
+	_count_launch()
+	return tracing.run(["git", *args], capture_output = capture_output, check = check, text = True, input = input)
+
+def popen(args: List[str], **kwargs) -> subprocess.Popen:
+	"""
+	Start a git command (for streaming its output).
+
+	:param args: The arguments (without `git`).
+	:param kwargs: Pass these to `subprocess.Popen`.
+	:return: The process.
+	"""
+	_count_launch()
+	return tracing.popen(["git", *args], **kwargs)
+
+class _CoProcess(object):
+	"""A git process that answers one query per line (or NUL-terminated path) of standard input."""
+	def __init__(self, args: List[str]):
+		self.process = popen(args, stdin = subprocess.PIPE, stdout = subprocess.PIPE)
+		self.buffer = b""
+		self.lock = threading.Lock()
+
+	def query(self, text: str, separator: bytes, count: int) -> List[str]:
+		"""
+		Send a query, and return the answer.
+
+		:param text: The query (including its terminator).
+		:param separator: The separator between fields of the answer.
+		:param count: The number of fields in the answer.
+		:return: The fields.
+		:raise Exception: The process exited.
+		"""
+		with self.lock:
+			self.process.stdin.write(text.encode())
+			self.process.stdin.flush()
+
+			while self.buffer.count(separator) < count:
+				chunk = self.process.stdout.read1(_READ_SIZE)
+
+				if not chunk:
+					raise Exception(f"git exited unexpectedly ({' '.join(self.process.args)})")
+
+				self.buffer += chunk
+
+			*fields, self.buffer = self.buffer.split(separator, count)
+			return [field.decode("utf-8", errors = "replace") for field in fields]
+
+	def close(self) -> None:
+		"""Stop the process."""
+		self.process.stdin.close()
+		self.process.stdout.close()
+		self.process.wait()
+
+def _get_co_process(*args: str) -> _CoProcess:
+	"""
+	Return the co-process for a git command in the current working directory (start it if needed).
+
+	:param args: The arguments (without `git`).
+	:return: The co-process.
+	"""
+	key = (os.getcwd(), args)
+
+	with _LOCK:
+		# Replace co-processes that exited (for example, after a query git could not parse)
+		if key not in _CO_PROCESSES or _CO_PROCESSES[key].process.poll() is not None:
+			_CO_PROCESSES[key] = _CoProcess(list(args))
+
+		return _CO_PROCESSES[key]
+
+@functools.lru_cache(maxsize = None)
+def _get_repository(directory: str) -> Tuple[str, str]:
+	"""
+	Return the top-level directory and git directory of the repository in a directory.
+
+	:param directory: The directory.
+	:return: The absolute paths.
+	:raise subprocess.CalledProcessError: The directory is not in a git repository.
+	"""
+	toplevel, git_dir = run(["rev-parse", "--show-toplevel", "--absolute-git-dir"]).stdout.splitlines()
+	return toplevel, git_dir
+
+def get_toplevel() -> str:
+	"""
+	Return the root directory of the repository.
+
+	:return: The absolute path.
+	:raise subprocess.CalledProcessError: The current working directory is not in a git repository.
+	"""
+	return _get_repository(os.getcwd())[0]
+
+def get_git_path(name: str) -> str:
+	"""
+	Return the path of a file in the git directory.
+
+	:param name: The name of the file.
+	:return: The absolute path.
+	:raise subprocess.CalledProcessError: The current working directory is not in a git repository.
+	"""
+	return os.path.join(_get_repository(os.getcwd())[1], name)
+
+def get_common_path(name: str) -> str:
+	"""
+	Return the path of a file in the git directory shared by all worktrees (where refs and `packed-refs` are kept).
+
+	:param name: The name of the file.
+	:return: The absolute path.
+	:raise subprocess.CalledProcessError: The current working directory is not in a git repository.
+	"""
+	git_dir = _get_repository(os.getcwd())[1]
+
+	try:
+		with open(os.path.join(git_dir, "commondir"), encoding = "utf-8") as f:
+			git_dir = os.path.normpath(os.path.join(git_dir, f.read().strip()))
+	except FileNotFoundError:
+		pass
+
+	return os.path.join(git_dir, name)
+
+def _read_ref(name: str) -> Optional[str]:
+	"""
+	Return the object name of a ref by reading its loose file or `packed-refs` (without starting git).
+
+	:param name: The full name of the ref (for example, `refs/heads/main`).
+	:return: The object name, or `None` if the ref could not be read this way.
+	"""
+	try:
+		with open(get_common_path(name), encoding = "utf-8") as f:
+			value = f.read().strip()
+
+		return value if _OBJECT_NAME_REGEX.fullmatch(value) else None
+	except (FileNotFoundError, IsADirectoryError, NotADirectoryError):
+		pass
+
+	try:
+		with open(get_common_path("packed-refs"), encoding = "utf-8") as f:
+			for line in f:
+				value, _, ref = line.rstrip("\n").partition(" ")
+
+				if ref == name and _OBJECT_NAME_REGEX.fullmatch(value):
+					return value
+	except FileNotFoundError:
+		pass
+
+	return None
+
+def read_head() -> Optional[str]:
+	"""
+	Return the object name of HEAD, reading the git directory instead of starting git when possible.
+
+	:return: The full object name, or `None` if there are no commits.
+	:raise subprocess.CalledProcessError: The current working directory is not in a git repository.
+	"""
+	try:
+		with open(get_git_path("HEAD"), encoding = "utf-8") as f:
+			head = f.read().strip()
+	except FileNotFoundError:
+		head = ""
+
+	if _OBJECT_NAME_REGEX.fullmatch(head):
+		return head
+
+	# Let git handle symbolic refs to missing refs, and other ref storage
+	value = _read_ref(head[5:]) if head.startswith("ref: refs/") else None
+	return value or get_head()
+
+@functools.lru_cache(maxsize = None)
+def _has_branch(directory: str) -> bool:
+	"""
+	Return whether any branch exists in the repository in a directory.
+
+	:param directory: The directory.
+	:return: Whether a branch exists.
+	:raise subprocess.CalledProcessError: Failed to check for branches.
+	"""
+	return bool(run(["branch", "--list"]).stdout.strip())
+
+def has_branch() -> bool:
+	"""
+	Return whether any branch exists.
+
+	:return: Whether a branch exists.
+	:raise subprocess.CalledProcessError: Failed to check for branches.
+	"""
+	return _has_branch(os.getcwd())
+
+@functools.lru_cache(maxsize = None)
+def _get_merged_tags(directory: str, prefix: str, commit: str) -> Tuple[str, ...]:
+	"""
+	Return the names of tags with a prefix merged into a commit in the repository in a directory.
+
+	:param directory: The directory.
+	:param prefix: The prefix.
+	:param commit: The commit.
+	:return: The names.
+	:raise subprocess.CalledProcessError: Failed to get tags.
+	"""
+	return tuple(tag.strip() for tag in run(["tag", "--sort=-version:refname", "--list", f"{prefix}*", "--merged", commit]).stdout.split("\n") if tag.strip())
+
+def get_merged_tags(prefix: str = "", commit: str = "HEAD") -> Tuple[str, ...]:
+	"""
+	Return the names of tags with a prefix merged into a commit.
+
+	:param prefix: The prefix.
+	:param commit: The commit.
+	:return: The names (highest version first).
+	:raise subprocess.CalledProcessError: Failed to get tags.
+	"""
+	return _get_merged_tags(os.getcwd(), prefix, commit)
+
+def resolve(revision: str) -> Optional[str]:
+	"""
+	Return the object name a revision refers to (using a `git cat-file --batch-check` co-process).
+
+	:param revision: The revision (for example, `HEAD`, but not `@{upstream}`, which stops the co-process if it is missing).
+	:return: The full object name, or `None` if the revision does not exist.
+	:raise Exception: The co-process exited.
+	"""
+	if "\n" in revision:
+		return None
+
+	answer = _get_co_process("cat-file", "--batch-check").query(f"{revision}\n", b"\n", 1)[0]
+	return None if answer.endswith(" missing") or answer.endswith(" ambiguous") else answer.split(" ")[0]
+
+def get_head() -> Optional[str]:
+	"""
+	Return the object name of HEAD.
+
+	:return: The full object name, or `None` if there are no commits.
+	"""
+	return resolve("HEAD")
+
+def is_ignored(path: str, use_index: bool = True) -> bool:
+	"""
+	Return whether git ignores a path (using a `git check-ignore --stdin` co-process).
+
+	:param path: The path.
+	:param use_index: Consider whether the path is tracked (a tracked path is not ignored).
+	:return: Whether the path is ignored.
+	"""
+	args = ["check-ignore", "--stdin", "-z", "--non-matching", "--verbose"]
+
+	if not use_index:
+		args.append("--no-index")
+
+	pattern = _get_co_process(*args).query(f"{path}\0", b"\0", 4)[2]
+	return bool(pattern) and not pattern.startswith("!")
+
+def reset() -> None:
+	"""Forget facts about repositories, and stop co-processes (call this after changing the repository, or its ignore files)."""
+	with _LOCK:
+		for co_process in _CO_PROCESSES.values():
+			co_process.close()
+
+		_CO_PROCESSES.clear()
+
+	for function in [_get_repository, _has_branch, _get_merged_tags]:
+		function.cache_clear()
+
+def _print_launch_count() -> None:
+	"""Print the number of git processes started."""
+	print(f"git processes started: {_LAUNCH_COUNT}", file = sys.stderr)
+
+atexit.register(reset)
+
+if os.environ.get("GIT_SESSION_COUNT"):
+	atexit.register(_print_launch_count)
\ No newline at end of file
@@ -1,5 +1,8 @@
 """Settings for building the gitignore file."""
 
+import os, runpy
+from typing import Any, Dict, Optional
+
 FOLDER_PATTERN = "[a-zA-Z]*[a-zA-Z]"
 FILE_PATTERN = "[a-zA-Z]*[a-zA-Z]"
 
@@ -33,4 +36,59 @@ TEXT = """
 
 # Ignore these files
 %(ignore_files)s
-"""
\ No newline at end of file
+"""
+
+def get_settings(path: str = os.path.join("src", "config", "gitignore.py")) -> Dict[str, Any]:
+	"""
+	Return these settings combined with the settings in a project's settings file.
+
+	:param path: The path of the project's settings file.
+	:return: The combined settings (with the same names as the settings here).
+	"""
+	return combine_settings(runpy.run_path(path))
+
+def combine_settings(settings: Dict[str, Any]) -> Dict[str, Any]:
+	"""
+	Return these settings combined with a project's settings.
+
+	:param settings: The project's settings (the globals of its settings file).
+	:return: The combined settings (with the same names as the settings here).
+	"""
+	folder_pattern = settings.get("FOLDER_PATTERN", None)
+	file_pattern = settings.get("FILE_PATTERN", None)
+
+	return {
+		"FOLDER_PATTERN": folder_pattern if folder_pattern else FOLDER_PATTERN,
+		"FILE_PATTERN": file_pattern if file_pattern else FILE_PATTERN,
+		"ALLOW_DIRECTORIES": ALLOW_DIRECTORIES + settings.get("ALLOW_DIRECTORIES", []),
+		"IGNORE_DIRECTORIES": IGNORE_DIRECTORIES + settings.get("IGNORE_DIRECTORIES", []),
+		"ALLOW_EXTENSIONS": ALLOW_EXTENSIONS + settings.get("ALLOW_EXTENSIONS", []),
+		"ALLOW_FILES": ALLOW_FILES + settings.get("ALLOW_FILES", []),
+		"IGNORE_FILES": IGNORE_FILES + settings.get("IGNORE_FILES", []),
+		"TEXT": settings.get("TEXT", ""),
+	}
+
+def get_text(settings: Optional[Dict[str, Any]] = None) -> str:
+	"""
+	Return the contents of the gitignore file.
+
+	:param settings: The combined settings (from `get_settings`, which is used by default).
+	:return: The contents (without the comment saying the file is generated).
+	"""
+	if settings is None:
+		settings = get_settings()
+
+	text = TEXT.strip()
+	extra = settings["TEXT"].strip()
+
+	if extra:
+		text += "\n\n" + extra
+
+	return text % {
+		"folder_pattern": settings["FOLDER_PATTERN"],
+		"allow_directories": "\n".join([f"!{directory}/" for directory in settings["ALLOW_DIRECTORIES"]]),
+		"ignore_directories": "\n".join([f"{directory}/" for directory in settings["IGNORE_DIRECTORIES"]]),
+		"allow_extensions": "\n".join([f"!{settings['FILE_PATTERN']}.{extension}" for extension in settings["ALLOW_EXTENSIONS"]]),
+		"allow_files": "\n".join([f"!{path}" for path in settings["ALLOW_FILES"]]),
+		"ignore_files": "\n".join(settings["IGNORE_FILES"]),
+	}
\ No newline at end of file
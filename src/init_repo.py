@@ -1,125 +1,291 @@
-"""Initialize the repository (run this after creating the repository, or after changing config/)."""
+"""
+Initialize the repository (run this after creating the repository, or after changing config/).
 
-import gitignore, os, re, runpy, shutil, subprocess
-import checks
+Pass the roots of several repositories (or globs) to initialize them at the same time, using the templates in one checkout of the tools.
+Files are only written if their contents change (use `--check` to list out-of-date files without writing anything).
+
+:usage: `python3 init_repo.py --help`.
+"""
+
+import argparse, concurrent.futures, glob, gitignore, os, re, runpy, sys
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import checks, files, git_session, tracing
 
 _GENERATED_COMMENT = "# Note: This file may be regenerated (modify \"src/config/\" instead)\n\n"
+_TOOL_URL = "https://github.com/oaahmad/.github"
+_TOOL_PATH = os.path.join("src", "tools", "git-tools")
+# Copy the files in these directories of the tools to the same directories of the repository
+_TEMPLATE_DIRECTORIES = [os.path.join("src", "tools", "hooks"), os.path.join(".github", "workflows"), os.path.join(".github", "ISSUE_TEMPLATE")]
 
-def _make_gitignore() -> None:
-	"""Make the gitignore file."""
-	settings = runpy.run_path(os.path.join("src", "config", "gitignore.py"))
-	allow_directories = gitignore.ALLOW_DIRECTORIES + settings.get("ALLOW_DIRECTORIES", [])
-	ignore_directories = gitignore.IGNORE_DIRECTORIES + settings.get("IGNORE_DIRECTORIES", [])
-	allow_extensions = gitignore.ALLOW_EXTENSIONS + settings.get("ALLOW_EXTENSIONS", [])
-	allow_files = gitignore.ALLOW_FILES + settings.get("ALLOW_FILES", [])
-	ignore_files = gitignore.IGNORE_FILES + settings.get("IGNORE_FILES", [])
+def _read_directory(path: str) -> Dict[str, Tuple[bytes, bool]]:
+	"""
+	Return the contents of the files in a directory (including subdirectories).
 
-	text = gitignore.TEXT.strip()
-	extra = settings.get("TEXT", "").strip()
+	:param path: The path of the directory.
+	:return: The contents of each file, and whether it is executable (by path relative to the directory).
+	"""
+	contents = {}
 
-	if extra:
-		text += "\n\n" + extra
+	for directory, _, file_names in os.walk(path):
+		for name in file_names:
+			file_path = os.path.join(directory, name)
+
+			with open(file_path, "rb") as f:
+				contents[os.path.relpath(file_path, path)] = f.read(), os.access(file_path, os.X_OK)
+
+	return contents
 
-	folder_pattern = settings.get("FOLDER_PATTERN", None)
-	folder_pattern = folder_pattern if folder_pattern else gitignore.FOLDER_PATTERN
-	file_pattern = settings.get("FILE_PATTERN", None)
-	file_pattern = file_pattern if file_pattern else gitignore.FILE_PATTERN
-
-	text %= {
-		"folder_pattern": folder_pattern,
-		"allow_directories": "\n".join([f"!{directory}/" for directory in allow_directories]),
-		"ignore_directories": "\n".join([f"{directory}/" for directory in ignore_directories]),
-		"allow_extensions": "\n".join([f"!{file_pattern}.{extension}" for extension in allow_extensions]),
-		"allow_files": "\n".join([f"!{path}" for path in allow_files]),
-		"ignore_files": "\n".join(ignore_files),
+@tracing.phase("init_repo.load_templates")
+def load_templates(tool_path: str = _TOOL_PATH) -> Dict[str, Any]:
+	"""
+	Read the templates the repository is initialized from.
+
+	:param tool_path: The path of a checkout of the tools.
+	:return: The templates (pass these to `init_repo`).
+	"""
+	templates: Dict[str, Any] = {
+		# Only files directly in the config directory (not caches)
+		"config": {entry: contents for entry, (contents, _) in _read_directory(os.path.join(tool_path, "src", "config")).items() if os.sep not in entry},
+		"directories": {directory: _read_directory(os.path.join(tool_path, directory)) for directory in _TEMPLATE_DIRECTORIES},
 	}
 
-	with open(".gitignore", "w") as f:
-		f.write(_GENERATED_COMMENT)
-		f.write(text)
+	for key, path in [("readme", os.path.join("src", "resources", "README.md")), ("makefile", "Makefile"), ("gitattributes", ".gitattributes"), ("editorconfig", ".editorconfig")]:
+		with open(os.path.join(tool_path, path)) as f:
+			templates[key] = f.read()
+
+	return templates
 
-def init_repo() -> None:
+def _add_submodule(url: str) -> bool:
 	"""
-	Initialize the repository (run this after creating the repository, or after changing config/).
+	Add the tools as a submodule (if they were not added), and initialize all submodules.
 
+	:param url: The URL of the tools repository.
+	:return: Whether the submodule was added.
 	:raise subprocess.CalledProcessError: A shell command failed.
-	:raise AssertionError: The current working directory is not the root of a git repository.
 	"""
-	checks.assert_is_root()
+	added = not os.path.isdir(_TOOL_PATH)
 
-	repo_name = os.path.basename(os.getcwd())
+	if added:
+		# git only clones submodules from local repositories if this is allowed
+		options = ["-c", "protocol.file.allow=always"] if os.path.isdir(url) or url.startswith("file:") else []
+		git_session.run([*options, "submodule", "add", "-f", url, _TOOL_PATH], capture_output = False)
 
-	if repo_name == ".github":
-		_make_gitignore()
-		return
+	# Initialize all submodules
+	git_session.run(["submodule", "init"], capture_output = False)
+	return added
 
-	tool_path = os.path.join("src", "tools", "git-tools")
+def _read_config(templates: Dict[str, Any], name: str) -> bytes:
+	"""
+	Return the contents of a config file (from the template if the repository does not have it yet).
 
-	if not os.path.isdir(tool_path):
-		# Add the git-tools submodule
-		subprocess.run(["git", "submodule", "add", "-f", "https://github.com/oaahmad/.github", tool_path], capture_output = False, check = True, text = True)
+	:param templates: The templates (from `load_templates`).
+	:param name: The name of the file in `src/config`.
+	:return: The contents.
+	"""
+	try:
+		with open(os.path.join("src", "config", name), "rb") as f:
+			return f.read()
+	except FileNotFoundError:
+		return templates["config"][name]
 
-	# Initialize all submodules
-	subprocess.run(["git", "submodule", "init"], capture_output = False, check = True, text = True)
+def _run_config(templates: Dict[str, Any], name: str) -> Dict[str, Any]:
+	"""
+	Run a config file (from the template if the repository does not have it yet).
+
+	:param templates: The templates (from `load_templates`).
+	:param name: The name of the Python file in `src/config`.
+	:return: The globals of the file.
+	"""
+	path = os.path.join("src", "config", name)
+
+	if os.path.isfile(path):
+		return runpy.run_path(path)
 
-	os.makedirs(os.path.join("src", "config"), exist_ok = True)
-	config_path = os.path.join(tool_path, "src", "config")
+	settings: Dict[str, Any] = {}
+	exec(compile(templates["config"][name], path, "exec"), settings)
+	return settings
 
-	for entry in os.listdir(config_path):
-		source = os.path.join(config_path, entry)
+@tracing.phase("init_repo.render")
+def _render(templates: Optional[Dict[str, Any]], repo_name: str) -> Dict[str, Tuple[bytes, Optional[bool]]]:
+	"""
+	Render the files the tools generate in the repository (without writing them).
+
+	:param templates: The templates (from `load_templates`), or `None` to only render the gitignore file (from the repository's config).
+	:param repo_name: The name of the repository.
+	:return: The contents of each file, and whether it is executable (`None` to keep existing permissions), by path.
+	"""
+	if templates is None:
+		return {".gitignore": ((_GENERATED_COMMENT + gitignore.get_text()).encode(), None)}
+
+	outputs: Dict[str, Tuple[bytes, Optional[bool]]] = {}
+
+	# Only add config files, and the readme, if they are missing (projects change them)
+	for entry, contents in templates["config"].items():
 		target = os.path.join("src", "config", entry)
 
-		if os.path.isfile(source) and not os.path.isfile(target):
-			shutil.copy(source, target)
+		if not os.path.isfile(target):
+			outputs[target] = contents, None
 
-	with open(os.path.join("src", "config", "url.txt")) as f:
-		url = f.read().strip()
+	url = _read_config(templates, "url.txt").decode().strip()
 
 	if not os.path.isfile("README.md"):
-		with open(os.path.join(tool_path, "src", "resources", "README.md")) as source, open("README.md", "w") as target:
-			target.write(source.read().replace("{{repo}}", repo_name).replace("{{url}}", url))
+		outputs["README.md"] = templates["readme"].replace("{{repo}}", repo_name).replace("{{url}}", url).encode(), None
 
-	with open(os.path.join(tool_path, "Makefile")) as source, open("Makefile", "w") as target:
-		target.write(_GENERATED_COMMENT)
-		target.write(re.sub(r"^\s*_TOOL_PATH\s*\=.*", "_TOOL_PATH=./src/tools/git-tools/src", source.read(), count = 1))
+	text = re.sub(r"^\s*_TOOL_PATH\s*\=.*", "_TOOL_PATH=./src/tools/git-tools/src", templates["makefile"], count = 1)
+	outputs["Makefile"] = (_GENERATED_COMMENT + text).encode(), None
 
-	filename = ".gitattributes"
+	text = _GENERATED_COMMENT + templates["gitattributes"]
+	extra = _read_config(templates, ".gitattributes").decode()
 
-	with open(os.path.join(tool_path, filename)) as source1, open(os.path.join("src", "config", filename)) as source2, open(filename, "w") as target:
-		target.write(_GENERATED_COMMENT)
-		target.write(source1.read())
-		text = source2.read()
+	if extra:
+		text += "\n\n" + extra
 
-		if text:
-			target.write("\n\n")
-			target.write(text)
+	outputs[".gitattributes"] = text.encode(), None
 
-	settings = runpy.run_path(os.path.join("src", "config", "editorconfig.py"))
+	settings = _run_config(templates, "editorconfig.py")
 	ignore = settings.get("IGNORE", "")
 	extra = settings.get("TEXT", "").strip()
 	unset = ["indent_style", "indent_size", "end_of_line", "charset", "trim_trailing_whitespace", "insert_final_newline"]
 	unset_lines = "\n".join([f"{line} = unset" for line in unset])
-
-	with open(os.path.join(tool_path, ".editorconfig")) as f:
-		text = f.read()
+	text = templates["editorconfig"]
 
 	if extra:
 		text += "\n\n" + extra
 
-	for glob in ignore:
-		text += f"\n\n# Ignore\n[{glob}]\n{unset_lines}"
+	for glob_pattern in ignore:
+		text += f"\n\n# Ignore\n[{glob_pattern}]\n{unset_lines}"
 
-	with open(".editorconfig", "w") as f:
-		f.write(_GENERATED_COMMENT)
-		f.write(text)
+	outputs[".editorconfig"] = (_GENERATED_COMMENT + text).encode(), None
+	settings = gitignore.combine_settings(_run_config(templates, "gitignore.py"))
+	outputs[".gitignore"] = (_GENERATED_COMMENT + gitignore.get_text(settings)).encode(), None
 
-	_make_gitignore()
-	shutil.copytree(os.path.join(tool_path, "src", "tools", "hooks"), os.path.join("src", "tools", "hooks"), dirs_exist_ok = True)
-	shutil.copytree(os.path.join(tool_path, ".github", "workflows"), os.path.join(".github", "workflows"), dirs_exist_ok = True)
-	shutil.copytree(os.path.join(tool_path, ".github", "ISSUE_TEMPLATE"), os.path.join(".github", "ISSUE_TEMPLATE"), dirs_exist_ok = True)
+	for directory, directory_files in templates["directories"].items():
+		for entry, (contents, executable) in directory_files.items():
+			outputs[os.path.join(directory, entry)] = contents, executable
 
-	if os.path.isfile("setup"):
+	return outputs
+
+@tracing.phase("init_repo.init_repo")
+def init_repo(templates: Optional[Dict[str, Any]] = None, url: str = _TOOL_URL, check: bool = False) -> List[str]:
+	"""
+	Initialize the repository (run this after creating the repository, or after changing config/).
+
+	:param templates: The templates to use (from `load_templates`, which reads the tools submodule by default).
+	:param url: The URL of the tools repository (to add the tools submodule if it is missing).
+	:param check: Only return the files that are out of date (do not change anything).
+	:return: The paths of the files that were written (or are out of date). Files whose contents would not change are not written.
+	:raise subprocess.CalledProcessError: A shell command failed.
+	:raise AssertionError: The current working directory is not the root of a git repository.
+	"""
+	checks.assert_is_root()
+
+	repo_name = os.path.basename(os.getcwd())
+	changed = []
+
+	if repo_name == ".github":
+		templates = None
+	elif check:
+		if not os.path.isdir(_TOOL_PATH):
+			return [_TOOL_PATH.replace(os.sep, "/")]
+	elif _add_submodule(url):
+		changed.append(".gitmodules")
+
+	if templates is None and repo_name != ".github":
+		templates = load_templates()
+
+	for path, (contents, executable) in _render(templates, repo_name).items():
+		if files.is_changed(path, contents, executable) if check else files.write_if_changed(path, contents, executable):
+			changed.append(path.replace(os.sep, "/"))
+
+	if check:
+		return changed
+
+	if ".gitignore" in changed:
+		# Running git processes may have read the old gitignore file
+		git_session.reset()
+
+	if changed and os.path.isfile("setup"):
 		os.remove("setup")
 
+	return changed
+
+def _init_repo_at(root: str, templates: Dict[str, Any], url: str, check: bool) -> List[str]:
+	"""
+	Initialize a repository (in a worker process).
+
+	:param root: The root of the repository.
+	:param templates: The templates (from `load_templates`).
+	:param url: The URL of the tools repository.
+	:param check: Only return the files that are out of date.
+	:return: The paths of the files that were written (or are out of date).
+	:raise subprocess.CalledProcessError: A shell command failed.
+	:raise AssertionError: The root is not the root of a git repository.
+	"""
+	os.chdir(root)
+	return init_repo(templates, url, check)
+
+@tracing.phase("init_repo.init_repos")
+def init_repos(roots: Iterable[str], tool_path: str = ".", url: str = _TOOL_URL, jobs: Optional[int] = None, check: bool = False) -> Dict[str, List[str]]:
+	"""
+	Initialize several repositories at the same time (each in its own process), and print the files that changed in each.
+
+	:param roots: The roots of the repositories (globs are expanded).
+	:param tool_path: The path of the checkout of the tools to read the templates from (once).
+	:param url: The URL of the tools repository (to add the tools submodule to repositories without it).
+	:param jobs: Initialize at most this many repositories at the same time (the number of CPUs by default).
+	:param check: Only print and return the files that are out of date (do not change anything).
+	:return: The paths of the files that were written (or are out of date) in each repository (by root).
+	:raise Exception: Repositories failed to initialize (every repository is initialized before this is raised).
+	"""
+	paths = []
+
+	for root in roots:
+		paths += sorted(glob.glob(root)) if glob.has_magic(root) else [root]
+
+	templates = load_templates(tool_path)
+	changes = {}
+	failures = []
+
+	with concurrent.futures.ProcessPoolExecutor(max_workers = jobs) as executor:
+		futures = {os.path.abspath(path): executor.submit(_init_repo_at, os.path.abspath(path), templates, url, check) for path in paths}
+
+		for root, future in futures.items():
+			try:
+				changes[root] = future.result()
+			except Exception as e:
+				print(f"✗ {root}: {e}", file = sys.stderr)
+				failures.append(root)
+				continue
+
+			print(f"{root}: {len(changes[root])} files {'out of date' if check else 'changed'}")
+
+			for path in changes[root]:
+				print(f"  {path}")
+
+	if failures:
+		raise Exception(f"{len(failures)} of {len(futures)} repositories failed to initialize")
+
+	return changes
+
 if __name__ == "__main__":
-	init_repo()
\ No newline at end of file
+	_PARSER = argparse.ArgumentParser()
+	_PARSER.add_argument("roots", nargs = "*", metavar = "ROOT", help = "initialize these repositories (or globs of repositories) instead of the current one")
+	_PARSER.add_argument("--tool-path", default = ".", help = "the checkout of the tools to read templates from (with ROOT)")
+	_PARSER.add_argument("--url", default = _TOOL_URL, help = "the URL of the tools repository (to add it as a submodule)")
+	_PARSER.add_argument("--jobs", type = int, default = None, help = "initialize this many repositories at the same time")
+	_PARSER.add_argument("--check", action = "store_true", help = "list out-of-date files without writing anything (and fail if there are any)")
+	_ARGS = _PARSER.parse_args()
+
+	if _ARGS.roots:
+		_CHANGES = init_repos(_ARGS.roots, tool_path = _ARGS.tool_path, url = _ARGS.url, jobs = _ARGS.jobs, check = _ARGS.check)
+		_OUTDATED = any(_CHANGES.values())
+	else:
+		_CHANGES = init_repo(url = _ARGS.url, check = _ARGS.check)
+		_OUTDATED = bool(_CHANGES)
+
+		if _ARGS.check:
+			for _PATH in _CHANGES:
+				print(_PATH)
+
+	if _ARGS.check and _OUTDATED:
+		sys.exit(1)
\ No newline at end of file
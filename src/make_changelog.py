@@ -4,44 +4,294 @@ Make a changelog from the repository's annotated git tags.
 :usage: `python3 make_changelog.py --help`.
 """
 
-import argparse, subprocess
-from typing import Optional
-import checks
+import argparse, contextlib, json, os, re, subprocess
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+import checks, files, git_session, tracing
 
-def make_changelog(prefix: Optional[str] = None, file_name: str = "CHANGELOG.md") -> None:
+_TITLE = "# Changelog"
+# The version in the first (newest) section of an existing changelog
+_NEWEST_VERSION_REGEX = re.compile(re.escape(_TITLE) + r"\n\n## (?P<version>.+) \(")
+# Tag fields are separated by NUL bytes (refnames, dates, and tag messages cannot contain them)
+_TAG_FORMAT = "%(refname:strip=2)%00%(taggerdate:format:%B %d, %Y)%00%(contents)%00"
+_READ_SIZE = 65536
+_FORMATS = ["markdown", "json", "ndjson"]
+
+def _read_tags() -> Iterator[Tuple[str, str, str]]:
 	"""
-	Make a changelog from the repository's git tags.
+	Stream the merged tags from one `git for-each-ref` process.
 
-	:param prefix: Only use tags with this prefix.
-	:param file_name: Name the created changelog file this.
+	:return: The name, tagger date, and message of each tag (newest version first). Closing the iterator early stops git.
+	:raise subprocess.CalledProcessError: Failed to get tags.
+	"""
+	args = ["for-each-ref", "--sort=-version:refname", "--merged", "HEAD", f"--format={_TAG_FORMAT}", "refs/tags/"]
+	process = git_session.popen(args, stdout = subprocess.PIPE)
+	fields = []
+	buffer = b""
+	finished = False
+
+	try:
+		while True:
+			chunk = process.stdout.read(_READ_SIZE)
+
+			if not chunk:
+				break
+
+			*complete, buffer = (buffer + chunk).split(b"\0")
+
+			for field in complete:
+				fields.append(field.decode("utf-8", errors = "replace"))
+
+				if len(fields) == 3:
+					# git ends each record with a newline (after the last NUL)
+					name, date, message = fields
+					name = name.lstrip("\n")
+					fields = []
+					yield name, date, message.strip()
+
+		finished = True
+	finally:
+		if not finished:
+			process.kill()
+
+		process.stdout.close()
+
+		if process.wait() != 0 and finished:
+			raise subprocess.CalledProcessError(process.returncode, process.args)
+
+def _make_section(version: str, date: str, message: str) -> str:
+	"""
+	Return the changelog section for a version.
+
+	:param version: The version (without the prefix).
+	:param date: The date of the version.
+	:param message: The message of the version.
+	:return: The section (including the blank line before it).
+	"""
+	section = f"\n\n## {version} ({date})"
+
+	if message:
+		section += f"\n\n{message}"
+
+	return section
+
+def _write_start(f: TextIO, output_format: str) -> None:
+	"""
+	Write the start of a changelog.
+
+	:param f: The changelog file.
+	:param output_format: The format of the changelog (see `make_changelogs`).
+	"""
+	if output_format == "markdown":
+		f.write(_TITLE)
+	elif output_format == "json":
+		f.write("[")
+
+def _write_version(f: TextIO, output_format: str, is_first: bool, tag: str, version: str, date: str, message: str) -> None:
+	"""
+	Write the entry for a version to a changelog.
+
+	:param f: The changelog file.
+	:param output_format: The format of the changelog (see `make_changelogs`).
+	:param is_first: Whether this is the first entry.
+	:param tag: The tag of the version.
+	:param version: The version (without the prefix).
+	:param date: The date of the version.
+	:param message: The message of the version.
+	"""
+	if output_format == "markdown":
+		f.write(_make_section(version, date, message))
+		return
+
+	entry = json.dumps({"version": version, "tag": tag, "date": date, "message": message})
+
+	if output_format == "json":
+		f.write(f"{'' if is_first else ','}\n{entry}")
+	else:
+		f.write(f"{entry}\n")
+
+def _write_end(f: TextIO, output_format: str, is_empty: bool) -> None:
+	"""
+	Write the end of a changelog.
+
+	:param f: The changelog file.
+	:param output_format: The format of the changelog (see `make_changelogs`).
+	:param is_empty: Whether the changelog has no entries.
+	"""
+	if output_format == "json":
+		f.write("]" if is_empty else "\n]")
+
+def _read_changelog(file_name: str) -> Tuple[Optional[str], Optional[str]]:
+	"""
+	Read an existing Markdown changelog.
+
+	:param file_name: The name of the changelog file.
+	:return: The changelog after its title, and the version in its newest section (`None` for both if the changelog is missing or has no sections).
+	"""
+	if not os.path.isfile(file_name):
+		return None, None
+
+	with open(file_name, encoding = "utf-8") as f:
+		text = f.read()
+
+	match = _NEWEST_VERSION_REGEX.match(text)
+
+	if not match:
+		return None, None
+
+	return text[len(_TITLE):], match.group("version")
+
+class _Changelog(object):
+	"""A changelog being made (or updated) from a scan of the tags."""
+	def __init__(self, prefix: str, file_name: str, output_format: str, incremental: bool, stack: contextlib.ExitStack):
+		self.prefix = prefix
+		self.file_name = file_name
+		self.output_format = output_format
+		self.stack = stack
+		self.f: Optional[TextIO] = None
+		self.count = 0
+		# The versions newer than the newest version in the existing changelog (while it may only need updating)
+		self.pending: List[Tuple[str, str, str, str]] = []
+		# How much of the existing changelog (after its title) matches the versions read since its newest version
+		self.checked: Optional[int] = None
+		self.body, self.newest_version = _read_changelog(file_name) if incremental and output_format == "markdown" else (None, None)
+
+		if self.newest_version is None:
+			self._start()
+
+	def _start(self) -> None:
+		"""Start making the changelog from scratch (with the versions read so far)."""
+		self.f = self.stack.enter_context(files.open_atomically(self.file_name))
+		_write_start(self.f, self.output_format)
+
+		for entry in self.pending:
+			self._write(*entry)
+
+		self.pending = []
+
+		# The sections that matched are already rendered
+		if self.checked:
+			self.f.write(self.body[:self.checked])
+			self.count += 1
+
+	def _write(self, tag: str, version: str, date: str, message: str) -> None:
+		"""Write the entry for a version (see `_write_version`)."""
+		_write_version(self.f, self.output_format, self.count == 0, tag, version, date, message)
+		self.count += 1
+
+	def add(self, tag: str, date: str, message: str) -> None:
+		"""
+		Add a version (newest version first).
+
+		:param tag: The tag of the version.
+		:param date: The date of the version.
+		:param message: The message of the version.
+		"""
+		version = tag.lstrip(self.prefix)
+
+		if self.f is not None:
+			self._write(tag, version, date, message)
+			return
+
+		if self.checked is None:
+			if version != self.newest_version:
+				self.pending.append((tag, version, date, message))
+				return
+
+			self.checked = 0
+
+		section = _make_section(version, date, message)
+		end = self.checked + len(section)
+
+		# Tags may have been changed, added, or deleted since the changelog was made
+		if self.body.startswith(section, self.checked) and (end == len(self.body) or self.body.startswith("\n\n## ", end)):
+			self.checked = end
+		else:
+			self._start()
+			self._write(tag, version, date, message)
+
+	def end(self) -> None:
+		"""Finish the changelog after the last version (rebuild it unless every section of the existing changelog matched)."""
+		if self.f is None:
+			if self.checked == len(self.body):
+				if self.pending:
+					with files.open_atomically(self.file_name) as f:
+						f.write(_TITLE)
+						f.write("".join(_make_section(*entry[1:]) for entry in self.pending))
+						f.write(self.body)
+
+				return
+
+			self._start()
+
+		_write_end(self.f, self.output_format, self.count == 0)
+
+@tracing.phase("make_changelog.make_changelogs")
+def make_changelogs(outputs: Iterable[Tuple[str, str]], output_format: str = "markdown", incremental: bool = False) -> None:
+	"""
+	Make changelogs for several tag prefixes from one scan of the repository's git tags.
+
+	:param outputs: The prefix, and the name of the changelog file to create, for each changelog. A tag is only added to the changelogs with the longest prefix it has (with prefixes `v` and `v1`, `v1.0.0` is only added to the `v1` changelog).
+	:param output_format: Write changelogs as Markdown (`markdown`), a JSON array (`json`), or one JSON object per line (`ndjson`). JSON entries have a `version`, `tag`, `date`, and `message`.
+	:param incremental: Only add versions newer than the newest version in each existing Markdown changelog (see `make_changelog`).
+	:raise Exception: The format is not supported.
 	:raise subprocess.CalledProcessError: Failed to get tags.
 	:raise AssertionError: The current working directory is not the root of a git repository.
 	"""
 	checks.assert_is_root()
 	checks.assert_branch_exists()
 
-	if prefix is None:
-		prefix = ""
+	if output_format not in _FORMATS:
+		raise Exception(f"{output_format} is not a changelog format (use {', '.join(_FORMATS)})")
+
+	with contextlib.ExitStack() as stack:
+		changelogs: Dict[str, List[_Changelog]] = {}
+
+		for prefix, file_name in outputs:
+			changelogs.setdefault(prefix, []).append(_Changelog(prefix, file_name, output_format, incremental, stack))
 
-	versions = subprocess.run(["git", "tag", "--sort=-version:refname", "--list", f"{prefix}*", "--merged"], capture_output = True, check = True, text = True).stdout.split("\n")
+		# Longest first, so each tag is matched to its longest prefix
+		prefixes = sorted(changelogs, key = len, reverse = True)
 
-	with open(file_name, "w") as f:
-		f.write("# Changelog")
+		for tag, date, message in _read_tags():
+			prefix = next((prefix for prefix in prefixes if tag.startswith(prefix)), None)
 
-		for version in versions:
-			version = version.strip()
+			for changelog in changelogs.get(prefix, []):
+				changelog.add(tag, date, message)
 
-			if version:
-				date = subprocess.run(["git", "tag", "--list", "--format=%(taggerdate:format:%B %d, %Y)", version], capture_output = True, check = True, text = True).stdout.strip()
-				f.write(f"\n\n## {version.lstrip(prefix)} ({date})")
-				message = subprocess.run(["git", "tag", "--list", "--format=%(contents)", version], capture_output = True, check = True, text = True).stdout.strip()
+		for prefix_changelogs in changelogs.values():
+			for changelog in prefix_changelogs:
+				changelog.end()
 
-				if message:
-					f.write(f"\n\n{message}")
+def make_changelog(prefix: Optional[str] = None, file_name: str = "CHANGELOG.md", incremental: bool = False, output_format: str = "markdown") -> None:
+	"""
+	Make a changelog from the repository's git tags.
+
+	:param prefix: Only use tags with this prefix.
+	:param file_name: Name the created changelog file this.
+	:param incremental: Only add versions newer than the newest version in the existing changelog. Every older section is still compared with its tag, and the changelog is rebuilt if any is outdated (a tag was changed, added below the newest version, or deleted). Changelogs in other formats are always rebuilt.
+	:param output_format: The format of the changelog (see `make_changelogs`).
+	:raise Exception: The format is not supported.
+	:raise subprocess.CalledProcessError: Failed to get tags.
+	:raise AssertionError: The current working directory is not the root of a git repository.
+	"""
+	make_changelogs([(prefix or "", file_name)], output_format = output_format, incremental = incremental)
 
 if __name__ == "__main__":
 	_PARSER = argparse.ArgumentParser()
 	_PARSER.add_argument("--prefix", default = None, help = "only use tags with this prefix")
 	_PARSER.add_argument("--file-name", default = "CHANGELOG.md", help = "name the created file this")
+	_PARSER.add_argument("--output", action = "append", default = [], metavar = "PREFIX=FILE", help = "make a changelog named FILE from tags with PREFIX (repeat to make several changelogs from one scan of the tags, instead of using --prefix and --file-name; each tag is only added to the changelogs with its longest prefix)")
+	_PARSER.add_argument("--format", choices = _FORMATS, default = "markdown", help = "the format of the changelog")
+	_PARSER.add_argument("--incremental", action = "store_true", help = "only add versions newer than those in the existing file (rebuild it if any older section is outdated)")
 	_ARGS = _PARSER.parse_args()
-	make_changelog(prefix = _ARGS.prefix, file_name = _ARGS.file_name)
\ No newline at end of file
+
+	if _ARGS.output:
+		_OUTPUTS = [output.partition("=")[::2] for output in _ARGS.output]
+
+		for _OUTPUT, (_PREFIX, _FILE_NAME) in zip(_ARGS.output, _OUTPUTS):
+			if "=" not in _OUTPUT or not _FILE_NAME:
+				_PARSER.error(f"--output must be PREFIX=FILE with a file name (got {_OUTPUT!r})")
+
+		make_changelogs(_OUTPUTS, output_format = _ARGS.format, incremental = _ARGS.incremental)
+	else:
+		make_changelog(prefix = _ARGS.prefix, file_name = _ARGS.file_name, incremental = _ARGS.incremental, output_format = _ARGS.format)
\ No newline at end of file
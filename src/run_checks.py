@@ -0,0 +1,73 @@
+"""
+Run the lint and test checks at the same time in one Python process.
+
+:usage: `python3 run_checks.py --help`.
+"""
+
+import argparse, concurrent.futures, sys, time
+from typing import Callable, Dict, Iterable, Optional
+import checks, eclint, git_session, test_gitignore, test_tags, version
+
+def _time(function: Callable[[], object]) -> float:
+	"""
+	Call a function, and return how long it took.
+
+	:param function: The function.
+	:return: The wall time (in seconds).
+	"""
+	start = time.perf_counter()
+	function()
+	return time.perf_counter() - start
+
+def run_checks(prefix: Optional[str] = None, semver: bool = False, no_metadata: bool = False, labels: Optional[Iterable[str]] = None, label_number: bool = False, changed_since: Optional[str] = None) -> None:
+	"""
+	Run eclint, version, test-gitignore, and test-tags at the same time, and print how long each took.
+
+	:param prefix: The prefix version tags have.
+	:param semver: Enforce Semantic Versioning 2.0 for versions and tags.
+	:param no_metadata: Ensure tags do not have metadata.
+	:param labels: Only allow these pre-release labels in tags.
+	:param label_number: Ensure tags with labels have associated numbers.
+	:param changed_since: Only lint untracked files and files changed since this ref (see `eclint.run_eclint`).
+	:raise Exception: A check failed (every check finishes before this is raised).
+	:raise AssertionError: The current working directory is not the root of a git repository.
+	"""
+	start = time.perf_counter()
+	# Learn the shared repository facts once before the checks start
+	checks.assert_is_root()
+	git_session.has_branch()
+
+	functions: Dict[str, Callable[[], object]] = {
+		"eclint": lambda: eclint.run_eclint(changed_since = changed_since, capture_output = True),
+		"version": lambda: print(version.get_version(prefix = prefix, semver = semver)),
+		"test-gitignore": test_gitignore.test_gitignore,
+		"test-tags": lambda: test_tags.test_tags(prefix = prefix, semver = semver, no_metadata = no_metadata, labels = labels, label_number = label_number),
+	}
+	failures = []
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers = len(functions)) as executor:
+		futures = {name: executor.submit(_time, function) for name, function in functions.items()}
+
+		for name, future in futures.items():
+			try:
+				print(f"✓ {name} ({future.result():.2f}s)")
+			except Exception as e:
+				print(f"✗ {name}: {e}", file = sys.stderr)
+				failures.append(name)
+
+	print(f"{time.perf_counter() - start:.2f}s total, {git_session.get_launch_count()} git processes")
+
+	if failures:
+		raise Exception(f"Checks failed: {', '.join(failures)}")
+
+if __name__ == "__main__":
+	_PARSER = argparse.ArgumentParser()
+	_PARSER.add_argument("--prefix", default = None, help = "the prefix version tags have")
+	_PARSER.add_argument("--semver", action = "store_true", help = "enforce Semantic Versioning 2.0")
+	_PARSER.add_argument("--no-metadata", action = "store_true", help = "disallow metadata in tags")
+	_PARSER.add_argument("--labels", default = "", help = "only allow these labels in tags (comma-separated)")
+	_PARSER.add_argument("--label-number", action = "store_true", help = "labels must have numbers")
+	_PARSER.add_argument("--changed-since", nargs = "?", const = "", default = None, metavar = "REF", help = "only lint untracked files and files changed since REF (the upstream branch by default)")
+	_ARGS = _PARSER.parse_args()
+	_LABELS = _ARGS.labels.split(",")
+	run_checks(prefix = _ARGS.prefix, semver = _ARGS.semver, no_metadata = _ARGS.no_metadata, labels = [label for label in _LABELS if label], label_number = _ARGS.label_number, changed_since = _ARGS.changed_since)
\ No newline at end of file
@@ -1,19 +1,280 @@
 """
 Setup the project, and check if requirements are installed (run this after cloning the repository).
 
+Each step is skipped if its inputs have not changed since it last succeeded (the fingerprints are kept in the git directory), except checking requirements.
+
 :usage: `python3 setup.py --help`.
 """
 
-import argparse, os, runpy, shutil, stat, subprocess
-from typing import Optional
-import checks
+import argparse, concurrent.futures, hashlib, importlib.metadata, os, re, runpy, shutil, stat, subprocess, sys, time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import checks, files, git_session, tracing
+
+try:
+	from packaging import requirements
+except ImportError:
+	requirements = None
+
+_FINGERPRINT_NAME = "setup-fingerprint.json"
+_HOOKS_PATH = os.path.join("src", "tools", "hooks")
+# A requirement that is only a project name (no version specifiers, markers, or options)
+_NAME_REGEX = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+
+def _hash_files(paths: List[str], extra: str = "") -> str:
+	"""
+	Return a fingerprint of files.
+
+	:param paths: The paths of the files (missing files are included as missing).
+	:param extra: Other text to include in the fingerprint.
+	:return: The fingerprint.
+	"""
+	digest = hashlib.sha256(extra.encode() + b"\0")
+
+	for path in paths:
+		digest.update(path.encode() + b"\0")
+
+		try:
+			with open(path, "rb") as f:
+				digest.update(f.read())
+		except FileNotFoundError:
+			digest.update(b"\1")
+
+		digest.update(b"\0")
+
+	return digest.hexdigest()
+
+def _list_hooks() -> List[str]:
+	"""
+	Return the names of the git hooks to install.
+
+	:return: The names.
+	"""
+	if not os.path.isdir(_HOOKS_PATH):
+		return []
+
+	return sorted(entry for entry in os.listdir(_HOOKS_PATH) if os.path.isfile(os.path.join(_HOOKS_PATH, entry)))
+
+def _install_hooks(hooks: List[str]) -> None:
+	"""
+	Copy git hooks to the git directory, and make them executable.
+
+	:param hooks: The names of the hooks.
+	"""
+	target = git_session.get_git_path("hooks")
+	os.makedirs(target, exist_ok = True)
+
+	for entry in hooks:
+		path = os.path.join(target, entry)
+		shutil.copyfile(os.path.join(_HOOKS_PATH, entry), path)
+		st = os.stat(path)
+		os.chmod(path, st.st_mode | stat.S_IEXEC)
+
+def _is_installed(line: str) -> bool:
+	"""
+	Return whether a line of a requirements file is satisfied by the running Python (without starting pip).
+
+	:param line: The line.
+	:return: Whether the requirement is satisfied (`False` if this cannot be decided without pip).
+	"""
+	line = line.split(" #", 1)[0].strip()
+
+	if not line or line.startswith("#"):
+		return True
+
+	if line.startswith("-"):
+		return False
+
+	if _NAME_REGEX.fullmatch(line):
+		name, specifier = line, None
+	elif requirements is not None:
+		try:
+			requirement = requirements.Requirement(line)
+		except requirements.InvalidRequirement:
+			return False
+
+		if requirement.url or requirement.extras or requirement.marker and not requirement.marker.evaluate():
+			return False
+
+		name, specifier = requirement.name, requirement.specifier
+	else:
+		return False
+
+	try:
+		installed_version = importlib.metadata.version(name)
+	except importlib.metadata.PackageNotFoundError:
+		return False
+
+	return specifier is None or specifier.contains(installed_version, prereleases = True)
+
+def _install_requirements(path: str) -> None:
+	"""
+	Install the requirements in a requirements file with pip, unless they are already installed.
+
+	:param path: The path of the requirements file.
+	:raise subprocess.CalledProcessError: pip failed.
+	"""
+	with open(path, encoding = "utf-8") as f:
+		lines = f.read().splitlines()
+
+	if all(_is_installed(line) for line in lines):
+		return
+
+	tracing.run([sys.executable, "-m", "pip", "install", "--requirement", path], capture_output = False, check = True)
+
+def _check_commands(commands: List[Dict[str, Any]]) -> None:
+	"""
+	Ensure commands have names and command lines, unique names, and that their requirements exist and do not form a cycle.
+
+	:param commands: The commands (see `src/config/setup.py`).
+	:raise Exception: The commands are invalid.
+	"""
+	for command in commands:
+		if "name" not in command or "command" not in command:
+			raise Exception(f"Named commands must have a \"name\" and a \"command\" ({command})")
+
+	names = [command["name"] for command in commands]
+	duplicates = sorted({name for name in names if names.count(name) > 1})
+
+	if duplicates:
+		raise Exception(f"Commands must have unique names ({', '.join(duplicates)})")
+
+	requires = {command["name"]: list(command.get("requires", [])) for command in commands}
 
-def setup(include: Optional[str] = None) -> None:
+	for name, required in requires.items():
+		missing = [requirement for requirement in required if requirement not in requires]
+
+		if missing:
+			raise Exception(f"The {name} command requires unknown commands ({', '.join(missing)})")
+
+	done = set()
+
+	while len(done) < len(requires):
+		ready = [name for name, required in requires.items() if name not in done and all(requirement in done for requirement in required)]
+
+		if not ready:
+			raise Exception(f"Commands require each other ({', '.join(sorted(set(requires) - done))})")
+
+		done.update(ready)
+
+def _run_command(command: List[str]) -> Tuple[int, str, float]:
+	"""
+	Run a command, and capture its output.
+
+	:param command: The command.
+	:return: The exit code, the output (standard output and standard error), and the wall time (in seconds). A command that cannot start exits with 127, and its output is the error.
+	"""
+	start = time.perf_counter()
+
+	try:
+		process = tracing.run(command, stdout = subprocess.PIPE, stderr = subprocess.STDOUT, text = True)
+	except OSError as e:
+		return 127, str(e), time.perf_counter() - start
+
+	return process.returncode, process.stdout, time.perf_counter() - start
+
+def _run_command_graph(commands: List[Dict[str, Any]], jobs: int) -> None:
+	"""
+	Run named commands, running each command once the commands it requires succeed (independent commands run at the same time).
+
+	:param commands: The commands (see `src/config/setup.py`).
+	:param jobs: Run at most this many commands at the same time.
+	:raise subprocess.CalledProcessError: A command failed (commands that already started finish first, and no more start).
+	"""
+	by_name = {command["name"]: command for command in commands}
+	pending = dict(by_name)
+	done = set()
+	times = {}
+	failure = None
+	start = time.perf_counter()
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers = max(jobs, 1)) as executor:
+		running = {}
+
+		while pending or running:
+			if failure is None:
+				for name, command in list(pending.items()):
+					if all(requirement in done for requirement in command.get("requires", [])):
+						running[executor.submit(_run_command, command["command"])] = name
+						del pending[name]
+
+			if not running:
+				break
+
+			finished, _ = concurrent.futures.wait(running, return_when = concurrent.futures.FIRST_COMPLETED)
+
+			for future in finished:
+				name = running.pop(future)
+				returncode, output, times[name] = future.result()
+				print(f"{'✓' if returncode == 0 else '✗'} {name} ({times[name]:.2f}s)")
+
+				if output:
+					print(output.rstrip("\n"))
+
+				if returncode == 0:
+					done.add(name)
+				elif failure is None:
+					failure = subprocess.CalledProcessError(returncode, by_name[name]["command"])
+
+	for name, seconds in sorted(times.items(), key = lambda item: -item[1]):
+		print(f"{seconds:8.2f}s {name}")
+
+	print(f"{time.perf_counter() - start:8.2f}s total")
+
+	if failure is not None:
+		raise failure
+
+def _run_commands(commands: List, imported: Dict, jobs: int) -> None:
+	"""
+	Run the project's setup commands, and its setup function.
+
+	:param commands: The commands (see `src/config/setup.py`). Commands without names run first, one at a time.
+	:param imported: The globals of the additional setup file.
+	:param jobs: Run at most this many named commands at the same time.
+	:raise Exception: The named commands are invalid.
+	:raise subprocess.CalledProcessError: A command failed.
+	"""
+	named_commands = [command for command in commands if isinstance(command, dict)]
+	# Before running anything
+	_check_commands(named_commands)
+
+	for command in commands:
+		if not isinstance(command, dict):
+			tracing.run(command, capture_output = False, check = True, text = True)
+
+	if named_commands:
+		_run_command_graph(named_commands, jobs)
+
+	if "setup" in imported:
+		imported["setup"]()
+
+def _run_step(fingerprints: Dict[str, str], name: str, fingerprint: str, function: Callable[[], None], force: bool = False) -> None:
+	"""
+	Run a setup step if its inputs changed since it last succeeded.
+
+	:param fingerprints: The fingerprint of the inputs of each step when it last succeeded (updated if the step runs).
+	:param name: The name of the step.
+	:param fingerprint: The fingerprint of the step's inputs.
+	:param function: The step.
+	:param force: Run the step even if its inputs have not changed.
+	"""
+	if force or fingerprints.get(name) != fingerprint:
+		# Run the step again next time if it fails
+		fingerprints.pop(name, None)
+
+		with tracing.phase(f"setup.{name}"):
+			function()
+
+		fingerprints[name] = fingerprint
+
+@tracing.phase("setup.setup")
+def setup(include: Optional[str] = None, requirements_path: Optional[str] = None, force: bool = False) -> None:
 	"""
 	Setup the project, and check if requirements are installed (run this after cloning the repository).
 
 	:param include: The path to an additional setup file to include.
-	:raise Exception: A required shell command is missing.
+	:param requirements_path: The path to a requirements file to install with pip.
+	:param force: Run every step, even if its inputs have not changed (requirements are always checked).
+	:raise Exception: A required shell command is missing, or the named commands are invalid.
 	:raise subprocess.CalledProcessError: A shell command failed.
 	:raise AssertionError: The current working directory is not the root of a git repository.
 	"""
@@ -22,38 +283,47 @@ def setup(include: Optional[str] = None) -> None:
 	required_commands = ["git", "make", "python", "pip"]
 	required_paths = []
 	commands = []
+	jobs = os.cpu_count() or 1
 
 	if include:
 		imported = runpy.run_path(include)
 		required_commands += imported.get("REQUIRED_COMMANDS", [])
 		required_paths += imported.get("REQUIRED_PATHS", [])
 		commands += imported.get("COMMANDS", [])
+		jobs = imported.get("JOBS") or jobs
+
+	missing_commands = [command for command in required_commands if shutil.which(command) is None]
 
-	for command in required_commands:
-		if shutil.which(command) is None:
-			raise Exception(f"The {command} command is required")
+	if len(missing_commands) == 1:
+		raise Exception(f"The {missing_commands[0]} command is required")
+	elif missing_commands:
+		raise Exception(f"The {', '.join(missing_commands)} commands are required")
 
 	for path in required_paths:
 		os.makedirs(path.replace("/", os.sep), exist_ok = True)
 
-	for command in commands:
-		subprocess.run(command, capture_output = False, check = True, text = True)
-
-	target = os.path.join(".git", "hooks")
-	shutil.copytree(os.path.join("src", "tools", "hooks"), target, dirs_exist_ok = True)
+	fingerprint_path = git_session.get_git_path(_FINGERPRINT_NAME)
+	fingerprints: Dict[str, str] = files.read_json(fingerprint_path, {})
+	submodules = git_session.run(["submodule", "status", "--recursive"]).stdout
+	hooks = _list_hooks()
+	# Hooks may have been removed from the git directory
+	hooks_missing = not all(os.path.isfile(git_session.get_git_path(os.path.join("hooks", entry))) for entry in hooks)
 
-	for entry in os.listdir(target):
-		path = os.path.join(target, entry)
+	try:
+		_run_step(fingerprints, "commands", _hash_files([include] if include else [], submodules), lambda: _run_commands(commands, imported if include else {}, jobs), force)
+		_run_step(fingerprints, "hooks", _hash_files([os.path.join(_HOOKS_PATH, entry) for entry in hooks]), lambda: _install_hooks(hooks), force or hooks_missing)
 
-		if os.path.isfile(path):
-			st = os.stat(path)
-			os.chmod(path, st.st_mode | stat.S_IEXEC)
-
-	if include and "setup" in imported:
-		imported["setup"]()
+		# This always runs (it checks installed versions in this process, so it is cheap, and packages may have been changed outside setup)
+		if requirements_path:
+			with tracing.phase("setup.requirements"):
+				_install_requirements(requirements_path)
+	finally:
+		files.write_json(fingerprint_path, fingerprints)
 
 if __name__ == "__main__":
 	_PARSER = argparse.ArgumentParser()
 	_PARSER.add_argument("--include", default = None, help = "path to the additional setup file")
+	_PARSER.add_argument("--requirements", default = None, help = "path to a requirements file to install with pip")
+	_PARSER.add_argument("--force", action = "store_true", help = "run every step even if its inputs have not changed")
 	_ARGS = _PARSER.parse_args()
-	setup(include = _ARGS.include)
\ No newline at end of file
+	setup(include = _ARGS.include, requirements_path = _ARGS.requirements, force = _ARGS.force)
\ No newline at end of file
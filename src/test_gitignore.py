@@ -1,8 +1,29 @@
-"""Test gitignore."""
+"""
+Test gitignore.
 
-import subprocess
-import checks
+:usage: `python3 test_gitignore.py --help`.
+"""
 
+import argparse, collections, random, subprocess, sys, threading, time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+import checks, git_session, gitignore, gitignore_matcher, tracing
+
+try:
+	import resource
+except ImportError:
+	# Not available on Windows
+	resource = None
+
+_SPECIAL_CHARACTERS = "._- 5"
+_ALLOWED_NAMES = ["Ab"] + [f"very{character}long{character}name" for character in _SPECIAL_CHARACTERS] + ["long" * 5]
+_IGNORED_NAMES = ["a", _SPECIAL_CHARACTERS[1]] + [f"{character}{character}" for character in _SPECIAL_CHARACTERS if character != "."] + [f"{character}name" for character in _SPECIAL_CHARACTERS] + [f"name{character}" for character in _SPECIAL_CHARACTERS]
+_IGNORED_EXTENSION = "blah"
+_GLOB_CHARACTERS = "*?[\\"
+_READ_SIZE = 65536
+# The most unexpected paths to show
+_MAX_EXAMPLES = 20
+
+@tracing.phase("test_gitignore.test_gitignore")
 def test_gitignore() -> None:
 	"""
 	Ensure the gitignore file(s) work as expected.
@@ -13,9 +34,8 @@ def test_gitignore() -> None:
 	"""
 	checks.assert_is_root()
 
-	special_characters = "._- 5"
-	allowed_names = ["Ab"] + [f"very{character}long{character}name" for character in special_characters] + ["long" * 5]
-	ignored_names = ["a", special_characters[1]] + [f"{character}{character}" for character in special_characters if character != "."] + [f"{character}name" for character in special_characters] + [f"name{character}" for character in special_characters]
+	allowed_names = _ALLOWED_NAMES
+	ignored_names = _IGNORED_NAMES
 
 	allowed_folders = allowed_names
 	allowed_root_folders = [".github"]
@@ -54,25 +74,249 @@ def test_gitignore() -> None:
 	for f in allowed_root_files:
 		keep_paths.append(f)
 
-	try:
-		ignored = subprocess.run(["git", "check-ignore", "--no-index", *keep_paths, *ignore_paths], capture_output = True, check = True, text = True)
-	except subprocess.CalledProcessError as e:
-		if ignored.returncode != 1:
-			raise e
+	message = []
 
-	if ignored.stdout.strip() != "\n".join(ignore_paths):
-		ignored = ignored.stdout.strip().split("\n")
-		message = []
+	for path in keep_paths:
+		if git_session.is_ignored(path, use_index = False):
+			message.append(f"{path} incorrectly ignored")
 
-		for path in keep_paths:
-			if path in ignored:
-				message.append(f"{path} incorrectly ignored")
-
-		for path in ignore_paths:
-			if path not in ignored:
-				message.append(f"{path} incorrectly kept")
+	for path in ignore_paths:
+		if not git_session.is_ignored(path, use_index = False):
+			message.append(f"{path} incorrectly kept")
 
+	if message:
 		raise Exception("\n".join(message))
 
+def _get_plain_names(entries: List[str], root: bool) -> List[str]:
+	"""
+	Return the entries of a setting that are names rather than globs or nested paths.
+
+	:param entries: The entries (for example, `gitignore.IGNORE_DIRECTORIES`).
+	:param root: Return the entries that only apply to the root directory (starting with "/") instead of the entries that apply anywhere.
+	:return: The names (without a leading "/").
+	"""
+	names = []
+
+	for entry in entries:
+		if any(character in entry for character in _GLOB_CHARACTERS):
+			continue
+
+		if root and entry.startswith("/") and "/" not in entry[1:]:
+			names.append(entry[1:])
+		elif not root and "/" not in entry:
+			names.append(entry)
+
+	return names
+
+def _get_name_pools(fan_out: int) -> Dict[str, List[str]]:
+	"""
+	Return the folder and file names to build paths from, grouped by whether they are kept (using the gitignore settings).
+
+	:param fan_out: The number of allowed folder and file names to make.
+	:return: The names for each group.
+	"""
+	settings = gitignore.get_settings()
+	# Add letters to make more names that still match the default folder and file patterns
+	allowed_names = [f"{_ALLOWED_NAMES[i % len(_ALLOWED_NAMES)]}{'x' * (i // len(_ALLOWED_NAMES))}" for i in range(fan_out)]
+	extensions = settings["ALLOW_EXTENSIONS"]
+
+	return {
+		"allowed_folders": allowed_names,
+		"allowed_root_folders": _get_plain_names(settings["ALLOW_DIRECTORIES"], True),
+		"ignored_folders": _IGNORED_NAMES + _get_plain_names(settings["IGNORE_DIRECTORIES"], False),
+		"ignored_root_folders": _get_plain_names(settings["IGNORE_DIRECTORIES"], True),
+		"allowed_files": [f"{name}.{extensions[i % len(extensions)]}" for i, name in enumerate(allowed_names)] + _get_plain_names(settings["ALLOW_FILES"], False),
+		"allowed_root_files": _get_plain_names(settings["ALLOW_FILES"], True),
+		"ignored_files": [f"{name}.{_IGNORED_EXTENSION}" for name in _ALLOWED_NAMES] + [f"{name}.{extensions[0]}" for name in _IGNORED_NAMES] + _get_plain_names(settings["IGNORE_FILES"], False),
+	}
+
+def generate_paths(count: int, depth: int = 8, fan_out: int = 16, ignored_ratio: float = 0.05, seed: int = 0) -> Iterator[Tuple[str, bool]]:
+	"""
+	Generate synthetic file paths, and whether the gitignore settings should keep each one.
+
+	:param count: The number of paths.
+	:param depth: The most folders in a path.
+	:param fan_out: The number of allowed names to choose from for each folder and file.
+	:param ignored_ratio: The chance each folder or file name is an ignored name.
+	:param seed: The seed for choosing names.
+	:return: The paths (relative to the root of the repository), and whether each should be kept.
+	"""
+	pools = _get_name_pools(fan_out)
+	rng = random.Random(seed)
+	root_folders = (pools["allowed_folders"] + pools["allowed_root_folders"], pools["ignored_folders"] + pools["ignored_root_folders"])
+	folders = (pools["allowed_folders"] + pools["ignored_root_folders"], pools["ignored_folders"])
+	root_files = (pools["allowed_files"] + pools["allowed_root_files"], pools["ignored_files"])
+	files = (pools["allowed_files"], pools["ignored_files"])
+
+	for _ in range(count):
+		folder_count = rng.randint(0, depth)
+		parts = []
+		keep = True
+
+		for level in range(folder_count + 1):
+			if level == folder_count:
+				allowed, ignored = root_files if level == 0 else files
+			else:
+				allowed, ignored = root_folders if level == 0 else folders
+
+			is_ignored = rng.random() < ignored_ratio
+			keep = keep and not is_ignored
+			parts.append(rng.choice(ignored if is_ignored else allowed))
+
+		yield "/".join(parts), keep
+
+def _get_max_memory() -> Optional[Tuple[int, int]]:
+	"""
+	Return the most memory used by this process and its finished child processes.
+
+	:return: The maximum resident set sizes (in kilobytes, or `None` if unavailable).
+	"""
+	if resource is None:
+		return None
+
+	# macOS reports bytes instead of kilobytes
+	scale = 1024 if sys.platform == "darwin" else 1
+	return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss // scale, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss // scale
+
+def _check_ignore(items: Iterable[Tuple[str, Any]]) -> Iterator[Tuple[str, Any, bool]]:
+	"""
+	Stream paths through one `git check-ignore --stdin -z --no-index` process.
+
+	:param items: Each path, and data to return with its result.
+	:return: Each path, its data, and whether git keeps it (in the same order).
+	:raise subprocess.CalledProcessError: Failed to check paths.
+	"""
+	data = collections.deque()
+	process = git_session.popen(["check-ignore", "--stdin", "-z", "--non-matching", "--verbose", "--no-index"], stdin = subprocess.PIPE, stdout = subprocess.PIPE)
+
+	def write_paths() -> None:
+		"""Write the paths to git (while the results are read)."""
+		try:
+			for path, item_data in items:
+				data.append(item_data)
+				process.stdin.write(path.encode() + b"\0")
+		finally:
+			process.stdin.close()
+
+	writer = threading.Thread(target = write_paths, daemon = True)
+	writer.start()
+	fields = []
+	buffer = b""
+
+	while True:
+		chunk = process.stdout.read1(_READ_SIZE)
+
+		if not chunk:
+			break
+
+		*complete, buffer = (buffer + chunk).split(b"\0")
+
+		for field in complete:
+			fields.append(field)
+
+			if len(fields) == 4:
+				pattern = fields[2].decode("utf-8", errors = "replace")
+				path = fields[3].decode("utf-8", errors = "replace")
+				fields = []
+				yield path, data.popleft(), not pattern or pattern.startswith("!")
+
+	writer.join()
+	process.stdout.close()
+
+	if process.wait() != 0:
+		raise subprocess.CalledProcessError(process.returncode, process.args)
+
+def _raise_unexpected(unexpected: List[str]) -> None:
+	"""
+	Raise an exception listing some unexpected paths, if there are any.
+
+	:param unexpected: Descriptions of the unexpected paths.
+	:raise Exception: There are unexpected paths.
+	"""
+	if unexpected:
+		raise Exception("\n".join(unexpected[:_MAX_EXAMPLES] + ([f"({len(unexpected) - _MAX_EXAMPLES} more)"] if len(unexpected) > _MAX_EXAMPLES else [])))
+
+@tracing.phase("test_gitignore.benchmark_gitignore")
+def benchmark_gitignore(count: int, depth: int = 8, fan_out: int = 16, ignored_ratio: float = 0.05, seed: int = 0) -> Dict[str, float]:
+	"""
+	Stream synthetic paths through `git check-ignore --stdin -z`, ensure each is kept or ignored as expected, and print the throughput and memory use.
+
+	:param count: The number of paths.
+	:param depth: The most folders in a path.
+	:param fan_out: The number of allowed names to choose from for each folder and file.
+	:param ignored_ratio: The chance each folder or file name is an ignored name.
+	:param seed: The seed for choosing names.
+	:return: The results (`paths`, `seconds`, `paths_per_second`, `unexpected`, and if available, `max_memory_kb` and `max_git_memory_kb`).
+	:raise Exception: A path is kept or ignored unexpectedly.
+	:raise subprocess.CalledProcessError: Failed to check paths.
+	:raise AssertionError: The current working directory is not the root of a git repository.
+	"""
+	checks.assert_is_root()
+
+	start = time.perf_counter()
+	checked = 0
+	unexpected = []
+
+	for path, keep, kept in _check_ignore(generate_paths(count, depth = depth, fan_out = fan_out, ignored_ratio = ignored_ratio, seed = seed)):
+		checked += 1
+
+		if kept != keep:
+			unexpected.append(f"{path} incorrectly {'kept' if kept else 'ignored'}")
+
+	seconds = time.perf_counter() - start
+	results = {"paths": checked, "seconds": seconds, "paths_per_second": checked / seconds if seconds else 0.0, "unexpected": len(unexpected)}
+	memory = _get_max_memory()
+
+	if memory:
+		results["max_memory_kb"], results["max_git_memory_kb"] = memory
+
+	print(", ".join(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}" for key, value in results.items()))
+	_raise_unexpected(unexpected)
+	return results
+
+@tracing.phase("test_gitignore.test_matcher")
+def test_matcher(count: int, depth: int = 8, fan_out: int = 16, ignored_ratio: float = 0.05, seed: int = 0) -> None:
+	"""
+	Ensure `gitignore_matcher` agrees with git about synthetic paths (using the gitignore file the settings make), and print how fast each is.
+
+	:param count: The number of paths.
+	:param depth: The most folders in a path.
+	:param fan_out: The number of allowed names to choose from for each folder and file.
+	:param ignored_ratio: The chance each folder or file name is an ignored name.
+	:param seed: The seed for choosing names.
+	:raise Exception: The matcher and git disagree about a path.
+	:raise subprocess.CalledProcessError: Failed to check paths.
+	:raise AssertionError: The current working directory is not the root of a git repository.
+	"""
+	checks.assert_is_root()
+
+	matcher = gitignore_matcher.compile_settings()
+	paths = [path for path, _ in generate_paths(count, depth = depth, fan_out = fan_out, ignored_ratio = ignored_ratio, seed = seed)]
+
+	start = time.perf_counter()
+	matcher_results = [not matcher.is_ignored(path) for path in paths]
+	matcher_seconds = time.perf_counter() - start
+
+	start = time.perf_counter()
+	unexpected = [f"{path} {'kept' if kept else 'ignored'} by git but not the matcher" for path, matcher_kept, kept in _check_ignore(zip(paths, matcher_results)) if kept != matcher_kept]
+	git_seconds = time.perf_counter() - start
+
+	print(f"paths: {len(paths)}, matcher_paths_per_second: {len(paths) / max(matcher_seconds, 1e-9):.2f}, git_paths_per_second: {len(paths) / max(git_seconds, 1e-9):.2f}, disagreements: {len(unexpected)}")
+	_raise_unexpected(unexpected)
+
 if __name__ == "__main__":
-	test_gitignore()
\ No newline at end of file
+	_PARSER = argparse.ArgumentParser()
+	_PARSER.add_argument("--benchmark", type = int, default = None, metavar = "COUNT", help = "check this many synthetic paths instead (and print the throughput)")
+	_PARSER.add_argument("--compare-matcher", type = int, default = None, metavar = "COUNT", help = "compare gitignore_matcher with git for this many synthetic paths instead")
+	_PARSER.add_argument("--depth", type = int, default = 8, help = "the most folders in a synthetic path")
+	_PARSER.add_argument("--fan-out", type = int, default = 16, help = "the number of allowed names for each synthetic folder and file")
+	_PARSER.add_argument("--ignored-ratio", type = float, default = 0.05, help = "the chance each synthetic name is ignored")
+	_PARSER.add_argument("--seed", type = int, default = 0, help = "the seed for synthetic paths")
+	_ARGS = _PARSER.parse_args()
+
+	if _ARGS.benchmark is not None:
+		benchmark_gitignore(_ARGS.benchmark, depth = _ARGS.depth, fan_out = _ARGS.fan_out, ignored_ratio = _ARGS.ignored_ratio, seed = _ARGS.seed)
+	elif _ARGS.compare_matcher is not None:
+		test_matcher(_ARGS.compare_matcher, depth = _ARGS.depth, fan_out = _ARGS.fan_out, ignored_ratio = _ARGS.ignored_ratio, seed = _ARGS.seed)
+	else:
+		test_gitignore()
\ No newline at end of file
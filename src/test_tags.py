@@ -4,11 +4,122 @@ Test the formatting of git tags.
 :usage: `python3 test_tags.py --help`.
 """
 
-import argparse, re, subprocess
-from typing import Optional, Iterable
-import checks, version
+import argparse, concurrent.futures, functools, subprocess
+from typing import Dict, Iterable, Iterator, List, Optional
+import checks, files, git_session, tracing, version
 
-def test_tags(prefix: Optional[str] = None, semver: bool = False, no_metadata: bool = False, labels: Optional[Iterable[str]] = None, label_number: bool = False) -> None:
+# The number of tags each process checks at a time
+_BATCH_SIZE = 10000
+# The most violations to include in the exception message
+_MAX_MESSAGES = 10
+
+def _read_tags(since: Optional[str] = None) -> Iterator[str]:
+	"""
+	Stream the names of tags from one git process.
+
+	:param since: Only return tags created after this tag (newest first).
+	:return: The names. Closing the iterator early stops git.
+	:raise subprocess.CalledProcessError: Failed to get tags.
+	"""
+	if since is None:
+		args = ["tag", "--list"]
+	else:
+		args = ["for-each-ref", "--sort=-creatordate", "--format=%(refname:strip=2)", "refs/tags/"]
+
+	process = git_session.popen(args, stdout = subprocess.PIPE, text = True, encoding = "utf-8", errors = "replace")
+	finished = False
+
+	try:
+		for line in process.stdout:
+			tag = line.strip()
+
+			if tag == since:
+				break
+
+			if tag:
+				yield tag
+		else:
+			finished = True
+	finally:
+		if not finished:
+			process.kill()
+
+		process.stdout.close()
+
+		if process.wait() != 0 and finished:
+			raise subprocess.CalledProcessError(process.returncode, process.args)
+
+def _check_tag(tag: str, prefix: str, semver: bool, no_metadata: bool, labels: List[str], label_number: bool) -> List[str]:
+	"""
+	Return the problems with a tag.
+
+	:param tag: The tag.
+	:param prefix: See `test_tags`.
+	:param semver: See `test_tags`.
+	:param no_metadata: See `test_tags`.
+	:param labels: See `test_tags`.
+	:param label_number: See `test_tags`.
+	:return: A message for each problem.
+	"""
+	if not tag.startswith(prefix):
+		return [f"{tag} does not start with {prefix}"]
+
+	messages = []
+
+	if semver:
+		tag = tag.lstrip(prefix)
+		match = version.SEMVER_PATTERN.match(tag)
+
+		if not match:
+			return [f"{tag} is not a valid Semantic Versioning 2.0 string"]
+
+		label = match.group("prerelease")
+
+		if labels and label:
+			if label_number and "." not in label:
+				messages.append(f"{tag} has a label without a number")
+
+			label = label.split(".")[0]
+
+			if label not in labels:
+				messages.append(f"{tag} has the invalid label {label}")
+
+	if no_metadata and "+" in tag:
+		messages.append(f"{tag} has metadata")
+
+	return messages
+
+def _check_tags(tags: List[str], **rules) -> List[Dict[str, str]]:
+	"""
+	Return the problems with tags.
+
+	:param tags: The tags.
+	:param rules: The rules (see `_check_tag`).
+	:return: The tag and message of each problem.
+	"""
+	return [{"tag": tag, "message": message} for tag in tags for message in _check_tag(tag, **rules)]
+
+def _batch(tags: Iterable[str]) -> Iterator[List[str]]:
+	"""
+	Group tags into batches.
+
+	:param tags: The tags.
+	:return: The batches (of `_BATCH_SIZE` tags, except the last).
+	"""
+	batch = []
+
+	for tag in tags:
+		batch.append(tag)
+
+		if len(batch) == _BATCH_SIZE:
+			yield batch
+			batch = []
+
+	if batch:
+		yield batch
+
+@tracing.phase("test_tags.test_tags")
+def test_tags(prefix: Optional[str] = None, semver: bool = False, no_metadata: bool = False, labels: Optional[Iterable[str]] = None, label_number: bool = False, since: Optional[str] = None, jobs: int = 1, report: Optional[str] = None) -> None:
 	"""
 	Ensure all git tags are formatted correctly.
 
@@ -16,49 +127,52 @@ def test_tags(prefix: Optional[str] = None, semver: bool = False, no_metadata: b
 	:param semver: Ensure tags are Semantic Versioning 2.0 compliant strings.
 	:param no_metadata: Ensure tags do not have metadata (assume metadata is added as in Semantic Versioning 2.0).
 	:param labels: Only allow these pre-release labels (ignored if semver is `False`).
-	:param label_number: Ensure tags with labels have associated numbers (ignored if semver is `False`).
-	:raise Exception: A tag is invalid.
+	:param label_number: Ensure tags with labels have associated numbers (ignored if semver is `False`, or there are no labels).
+	:param since: Only check tags created after this tag (by tagger date, or commit date for lightweight tags).
+	:param jobs: Check batches of tags in this many processes at the same time.
+	:param report: Write the number of tags checked and every problem to this JSON file.
+	:raise Exception: A tag is invalid (every tag is checked before this is raised).
 	:raise subprocess.CalledProcessError: Failed to get tags.
 	:raise AssertionError: The current working directory is not the root of a git repository.
 	"""
 	checks.assert_is_root()
 
-	labels = list(labels)
-
-	if prefix is None:
-		prefix = ""
-
-	tags = subprocess.run(["git", "tag", "--list"], capture_output = True, check = True, text = True).stdout.split("\n")
-	tags = [tag.strip() for tag in tags if tag.strip()]
+	if since is not None and git_session.resolve(f"refs/tags/{since}") is None:
+		raise Exception(f"{since} is not a tag")
 
-	if not tags:
-		return
-
-	for tag in tags:
-		if not tag.startswith(prefix):
-			raise Exception(f"{tag} does not start with {prefix}")
+	check = functools.partial(_check_tags, prefix = prefix or "", semver = semver, no_metadata = no_metadata, labels = list(labels or []), label_number = label_number)
+	count = 0
+	violations = []
+	tags = _read_tags(since)
 
-		if semver:
-			tag = tag.lstrip(prefix)
-			match = re.match(version.SEMVER_REGEX, tag)
+	try:
+		if jobs > 1:
+			with concurrent.futures.ProcessPoolExecutor(max_workers = jobs) as executor:
+				futures = []
 
-			if not match:
-				raise Exception(f"{tag} is not a valid Semantic Versioning 2.0 string")
+				for batch in _batch(tags):
+					count += len(batch)
+					futures.append(executor.submit(check, batch))
 
-			if labels:
-				label = match.group("prerelease")
+				for future in futures:
+					violations.extend(future.result())
+		else:
+			for batch in _batch(tags):
+				count += len(batch)
+				violations.extend(check(batch))
+	finally:
+		tags.close()
 
-				if label:
-					if label_number and "." not in label:
-						raise Exception(f"{tag} has a label without a number")
+	if report is not None:
+		files.write_json(report, {"checked": count, "violations": violations})
 
-					label = label.split(".")[0]
+	if violations:
+		messages = [violation["message"] for violation in violations[:_MAX_MESSAGES]]
 
-					if label not in labels:
-						raise Exception(f"{tag} has the invalid label {label.split('.')[0]}")
+		if len(violations) > _MAX_MESSAGES:
+			messages.append(f"({len(violations) - _MAX_MESSAGES} more)")
 
-		if no_metadata and "+" in tag:
-			raise Exception(f"{tag} has metadata")
+		raise Exception("\n".join(messages))
 
 if __name__ == "__main__":
 	_PARSER = argparse.ArgumentParser()
@@ -67,6 +181,9 @@ if __name__ == "__main__":
 	_PARSER.add_argument("--no-metadata", action = "store_true", help = "disallow metadata")
 	_PARSER.add_argument("--labels", default = "", help = "only allow these labels (comma-separated)")
 	_PARSER.add_argument("--label-number", action = "store_true", help = "labels must have numbers")
+	_PARSER.add_argument("--since", default = None, metavar = "TAG", help = "only check tags created after TAG")
+	_PARSER.add_argument("--jobs", type = int, default = 1, help = "check tags in this many processes")
+	_PARSER.add_argument("--report", default = None, metavar = "FILE", help = "write every problem to FILE (as JSON)")
 	_ARGS = _PARSER.parse_args()
 	_LABELS = _ARGS.labels.split(",")
-	test_tags(prefix = _ARGS.prefix, semver = _ARGS.semver, no_metadata = _ARGS.no_metadata, labels = [label for label in _LABELS if label], label_number = _ARGS.label_number)
\ No newline at end of file
+	test_tags(prefix = _ARGS.prefix, semver = _ARGS.semver, no_metadata = _ARGS.no_metadata, labels = [label for label in _LABELS if label], label_number = _ARGS.label_number, since = _ARGS.since, jobs = _ARGS.jobs, report = _ARGS.report)
\ No newline at end of file
@@ -0,0 +1,138 @@
+"""
+Test eclint against a throwaway repository, using a fake editorconfig-checker that records its arguments.
+
+:usage: `python3 -m unittest discover -s src/tests/integration`.
+"""
+
+import json, os, shutil, stat, subprocess, sys, tempfile, unittest
+from typing import List
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import eclint, git_session
+
+# The fake checker fails for paths containing this
+_BAD = "bad"
+# Leave this much of the argument limit after the environment
+_BUDGET = 20000
+# The longest environment variable Linux allows is 128 KiB
+_CHUNK_SIZE = 100000
+
+_CHECKER = f"""#!{sys.executable}
+import json, os, sys
+paths = sys.argv[{len(eclint._COMMAND)}:]
+
+with open(os.environ["ECLINT_TEST_LOG"], "a") as f:
+	f.write(json.dumps(paths) + "\\n")
+
+sys.exit(1 if any({_BAD!r} in path for path in paths) else 0)
+"""
+
+def _make_checker(directory: str) -> str:
+	"""
+	Make the fake editorconfig-checker.
+
+	:param directory: The directory to put it in.
+	:return: The path of the file it logs the paths of each run to.
+	"""
+	path = os.path.join(directory, eclint._COMMAND[0])
+
+	with open(path, "w") as f:
+		f.write(_CHECKER)
+
+	os.chmod(path, os.stat(path).st_mode | stat.S_IEXEC)
+	return os.path.join(directory, "log.ndjson")
+
+def _read_log(path: str) -> List[List[str]]:
+	"""
+	Return the paths of each run of the fake checker that was given paths.
+
+	:param path: The path of the log.
+	:return: The paths of each run.
+	"""
+	with open(path) as f:
+		return [paths for paths in map(json.loads, f) if paths]
+
+@unittest.skipIf(os.name == "nt", "the fake checker is a script")
+class TestBatches(unittest.TestCase):
+	"""Test splitting paths into editorconfig-checker runs."""
+	def setUp(self):
+		self.directory = os.getcwd()
+		self.temp_directory = tempfile.mkdtemp()
+		self.log_path = _make_checker(self.temp_directory)
+		repo = os.path.join(self.temp_directory, "repo")
+		subprocess.run(["git", "init", "--quiet", repo], check = True)
+		os.chdir(repo)
+		subprocess.run(["git", "commit", "--quiet", "--allow-empty", "-m", "Initial commit"], check = True, env = {**os.environ, "GIT_AUTHOR_NAME": "Test", "GIT_AUTHOR_EMAIL": "test@example.com", "GIT_COMMITTER_NAME": "Test", "GIT_COMMITTER_EMAIL": "test@example.com"})
+		self.paths = [f"folder/file{index:04}{_BAD if index in [0, 1999] else ''}.md" for index in range(2000)]
+		os.mkdir("folder")
+
+		for path in self.paths:
+			with open(path, "w") as f:
+				f.write("text\n")
+
+	def tearDown(self):
+		os.chdir(self.directory)
+		git_session.reset()
+		shutil.rmtree(self.temp_directory)
+
+	def test_small_budget(self):
+		"""Batches stay within an argument limit smaller than the Windows limit, and failures from every batch are counted."""
+		try:
+			limit = os.sysconf("SC_ARG_MAX")
+		except (AttributeError, ValueError, OSError):
+			self.skipTest("the argument limit is unknown")
+
+		environment = {"PATH": self.temp_directory + os.pathsep + os.environ.get("PATH", ""), "ECLINT_TEST_LOG": self.log_path}
+
+		with mock.patch.dict(os.environ, environment):
+			filler = eclint._get_max_length() - _BUDGET
+
+			if filler < 0 or filler > 100 * _CHUNK_SIZE:
+				self.skipTest(f"the argument limit ({limit}) is too small or too large")
+
+			# Each variable also costs its name and separators
+			for index in range(filler // _CHUNK_SIZE + 1):
+				os.environ[f"ECLINT_TEST_FILLER_{index}"] = "x" * max(min(_CHUNK_SIZE, filler - index * _CHUNK_SIZE) - 64, 0)
+
+			max_length = eclint._get_max_length()
+			self.assertLess(max_length, eclint._WINDOWS_MAX_LENGTH)
+
+			with self.assertRaisesRegex(Exception, r"\(2 of \d+ editorconfig-checker runs failed\)"):
+				eclint.run_eclint(use_cache = False)
+
+		runs = _read_log(self.log_path)
+		self.assertGreater(len(runs), 1)
+		self.assertEqual(sorted(path for paths in runs for path in paths), self.paths)
+
+		for paths in runs:
+			self.assertLessEqual(sum(len(argument) + eclint._ARGUMENT_OVERHEAD for argument in eclint._COMMAND + paths), max_length)
+
+	def test_jobs(self):
+		"""Each job gets a share of the paths."""
+		with mock.patch.dict(os.environ, {"PATH": self.temp_directory + os.pathsep + os.environ.get("PATH", ""), "ECLINT_TEST_LOG": self.log_path}):
+			with self.assertRaisesRegex(Exception, r"\(2 of 5 editorconfig-checker runs failed\)"):
+				eclint.run_eclint(jobs = 4, use_cache = False)
+
+		runs = _read_log(self.log_path)
+		self.assertEqual([len(paths) for paths in runs], [500] * 4)
+
+	def test_cache(self):
+		"""Parts of a failed run that pass are not checked again, and each run only checks a few parts again."""
+		failing_paths = self.paths
+
+		with mock.patch.dict(os.environ, {"PATH": self.temp_directory + os.pathsep + os.environ.get("PATH", ""), "ECLINT_TEST_LOG": self.log_path}):
+			for _ in range(3):
+				with self.assertRaisesRegex(Exception, r"\(1 of 1 editorconfig-checker runs failed\)"):
+					eclint.run_eclint()
+
+				runs = _read_log(self.log_path)
+				os.remove(self.log_path)
+				self.assertEqual(runs[0], failing_paths)
+				self.assertEqual(len(runs), 1 + eclint._RECHECK_PARTS)
+				# The first and last parts have the failing files
+				part_size = len(failing_paths) // eclint._RECHECK_PARTS
+				failing_paths = failing_paths[:part_size] + failing_paths[-part_size:]
+
+if __name__ == "__main__":
+	unittest.main()
\ No newline at end of file
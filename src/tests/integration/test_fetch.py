@@ -0,0 +1,106 @@
+"""
+Test fetching tags from a local bare repository.
+
+:usage: `python3 -m unittest discover -s src/tests/integration`.
+"""
+
+import os, shutil, subprocess, sys, tempfile, unittest
+from typing import Dict, List
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import fetch, git_session
+
+_ENVIRONMENT = {"GIT_AUTHOR_NAME": "Test", "GIT_AUTHOR_EMAIL": "test@example.com", "GIT_COMMITTER_NAME": "Test", "GIT_COMMITTER_EMAIL": "test@example.com"}
+
+def _git(path: str, args: List[str]) -> str:
+	"""
+	Run a git command in a repository.
+
+	:param path: The path of the repository.
+	:param args: The arguments (without `git`).
+	:return: The output.
+	"""
+	return subprocess.run(["git", "-C", path, *args], input = "", capture_output = True, text = True, check = True).stdout.strip()
+
+def _read_refs(path: str, pattern: str) -> Dict[str, str]:
+	"""
+	Return the refs of a repository.
+
+	:param path: The path of the repository.
+	:param pattern: Only return refs matching this pattern (see `git for-each-ref`).
+	:return: The object name of each ref (by name).
+	"""
+	return dict(line.split(" ")[::-1] for line in _git(path, ["for-each-ref", "--format=%(objectname) %(refname)", pattern]).splitlines())
+
+class TestFetch(unittest.TestCase):
+	"""Test fetching tags from a remote."""
+	def setUp(self):
+		self.directory = os.getcwd()
+		self.temp_directory = tempfile.mkdtemp()
+		self.environment = mock.patch.dict(os.environ, _ENVIRONMENT)
+		self.environment.start()
+		self.remote = os.path.join(self.temp_directory, "remote.git")
+		subprocess.run(["git", "init", "--quiet", "--bare", self.remote], check = True)
+		tree = _git(self.remote, ["mktree"])
+		self.commits = [_git(self.remote, ["commit-tree", tree, "-m", "Initial commit"])]
+		self.commits.append(_git(self.remote, ["commit-tree", tree, "-p", self.commits[0], "-m", "Second commit"]))
+		_git(self.remote, ["update-ref", "refs/heads/main", self.commits[1]])
+		_git(self.remote, ["symbolic-ref", "HEAD", "refs/heads/main"])
+
+		for name in ["v1.0.0", "v1.1.0", "v2.0.0"]:
+			_git(self.remote, ["tag", "-a", name, "-m", name, self.commits[0]])
+
+		self.clone = os.path.join(self.temp_directory, "clone")
+		subprocess.run(["git", "clone", "--quiet", self.remote, self.clone], check = True)
+		os.chdir(self.clone)
+
+	def tearDown(self):
+		os.chdir(self.directory)
+		git_session.reset()
+		self.environment.stop()
+		shutil.rmtree(self.temp_directory)
+
+	def _change_tags(self) -> None:
+		"""Add, move, and delete tags in the remote, and add a branch."""
+		_git(self.remote, ["tag", "-a", "v3.0.0", "-m", "v3.0.0", self.commits[1]])
+		_git(self.remote, ["tag", "-f", "-a", "v1.1.0", "-m", "moved", self.commits[1]])
+		_git(self.remote, ["tag", "-d", "v2.0.0"])
+		_git(self.remote, ["update-ref", "refs/heads/feature", self.commits[0]])
+
+	def _assert_fetched(self) -> None:
+		"""Ensure the local tags match the remote's, and branches were not fetched."""
+		self.assertEqual(_read_refs(self.clone, "refs/tags/"), _read_refs(self.remote, "refs/tags/"))
+		self.assertNotIn("refs/remotes/origin/feature", _read_refs(self.clone, "refs/remotes/"))
+
+	def test_up_to_date(self):
+		"""Nothing is fetched if the tags match."""
+		self.assertFalse(fetch.fetch())
+		self._assert_fetched()
+
+	def test_changes(self):
+		"""New and moved tags are fetched, and deleted tags are pruned."""
+		self._change_tags()
+		self.assertTrue(fetch.fetch())
+		self._assert_fetched()
+		self.assertFalse(fetch.fetch())
+
+	def test_wildcard(self):
+		"""Every tag is fetched at once if many changed."""
+		self._change_tags()
+
+		with mock.patch.object(fetch, "_MAX_REFSPECS", 0):
+			self.assertTrue(fetch.fetch())
+
+		self._assert_fetched()
+
+	def test_ttl(self):
+		"""The remote is not checked again until the TTL expires (unless forced)."""
+		self.assertFalse(fetch.fetch(ttl = 3600))
+		self._change_tags()
+		self.assertFalse(fetch.fetch(ttl = 3600))
+		self.assertTrue(fetch.fetch(ttl = 3600, force = True))
+		self._assert_fetched()
+
+if __name__ == "__main__":
+	unittest.main()
\ No newline at end of file
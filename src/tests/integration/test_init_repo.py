@@ -0,0 +1,64 @@
+"""
+Test initializing several repositories at the same time, with the tools cloned from a local bare repository.
+
+:usage: `python3 -m unittest discover -s src/tests/integration`.
+"""
+
+import os, pathlib, shutil, subprocess, sys, tempfile, unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import init_repo
+
+_TOOL_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..")
+_ENVIRONMENT = {"GIT_AUTHOR_NAME": "Test", "GIT_AUTHOR_EMAIL": "test@example.com", "GIT_COMMITTER_NAME": "Test", "GIT_COMMITTER_EMAIL": "test@example.com"}
+
+def _make_bare_repo(path: str) -> None:
+	"""
+	Make a bare repository with one commit.
+
+	:param path: The path of the repository.
+	"""
+	subprocess.run(["git", "init", "--quiet", "--bare", path], check = True)
+	tree = subprocess.run(["git", "-C", path, "mktree"], input = "", capture_output = True, text = True, check = True).stdout.strip()
+	commit = subprocess.run(["git", "-C", path, "commit-tree", tree, "-m", "Initial commit"], capture_output = True, text = True, check = True).stdout.strip()
+	subprocess.run(["git", "-C", path, "update-ref", "HEAD", commit], check = True)
+
+class TestInitRepos(unittest.TestCase):
+	"""Test initializing several repositories (fleet mode)."""
+	def setUp(self):
+		self.temp_directory = tempfile.mkdtemp()
+		self.environment = mock.patch.dict(os.environ, _ENVIRONMENT)
+		self.environment.start()
+		self.url = pathlib.Path(self.temp_directory, "tools.git").as_uri()
+		_make_bare_repo(os.path.join(self.temp_directory, "tools.git"))
+		self.roots = []
+
+		for name in ["one", "two"]:
+			_make_bare_repo(os.path.join(self.temp_directory, f"{name}.git"))
+			root = os.path.join(self.temp_directory, "repos", name)
+			subprocess.run(["git", "clone", "--quiet", os.path.join(self.temp_directory, f"{name}.git"), root], check = True)
+			self.roots.append(root)
+
+	def tearDown(self):
+		self.environment.stop()
+		shutil.rmtree(self.temp_directory)
+
+	def test_init_repos(self):
+		"""Every repository gets the tools submodule (from a file:// URL) and the generated files, and is then up to date."""
+		changes = init_repo.init_repos([os.path.join(self.temp_directory, "repos", "*")], tool_path = _TOOL_PATH, url = self.url, jobs = 2)
+		self.assertEqual(sorted(changes), self.roots)
+
+		for root in self.roots:
+			self.assertIn(".gitmodules", changes[root])
+			self.assertIn("Makefile", changes[root])
+			self.assertTrue(os.path.exists(os.path.join(root, init_repo._TOOL_PATH, ".git")))
+
+			with open(os.path.join(root, ".gitmodules")) as f:
+				self.assertIn(self.url, f.read())
+
+		changes = init_repo.init_repos(self.roots, tool_path = _TOOL_PATH, url = self.url, jobs = 2, check = True)
+		self.assertEqual(changes, {root: [] for root in self.roots})
+
+if __name__ == "__main__":
+	unittest.main()
\ No newline at end of file
@@ -0,0 +1,113 @@
+"""
+Test making changelogs incrementally against a throwaway repository.
+
+:usage: `python3 -m unittest discover -s src/tests/integration`.
+"""
+
+import os, shutil, subprocess, sys, tempfile, unittest
+from typing import List
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import git_session, make_changelog
+
+_ENVIRONMENT = {"GIT_AUTHOR_NAME": "Test", "GIT_AUTHOR_EMAIL": "test@example.com", "GIT_COMMITTER_NAME": "Test", "GIT_COMMITTER_EMAIL": "test@example.com"}
+
+def _git(args: List[str]) -> None:
+	"""
+	Run a git command in the current repository.
+
+	:param args: The arguments (without `git`).
+	"""
+	subprocess.run(["git", *args], capture_output = True, check = True)
+
+def _read(path: str) -> str:
+	"""
+	Return the contents of a file.
+
+	:param path: The path of the file.
+	:return: The contents.
+	"""
+	with open(path, encoding = "utf-8") as f:
+		return f.read()
+
+class TestIncremental(unittest.TestCase):
+	"""Test updating an existing changelog."""
+	def setUp(self):
+		self.directory = os.getcwd()
+		self.temp_directory = tempfile.mkdtemp()
+		self.environment = mock.patch.dict(os.environ, _ENVIRONMENT)
+		self.environment.start()
+		os.chdir(self.temp_directory)
+		_git(["init", "--quiet", "--initial-branch=main"])
+		_git(["commit", "--quiet", "--allow-empty", "-m", "Initial commit"])
+
+		for name in ["v1.0.0", "v1.1.0", "v2.0.0"]:
+			_git(["tag", "-a", name, "-m", f"Release {name}"])
+
+		make_changelog.make_changelog(prefix = "v")
+
+	def tearDown(self):
+		os.chdir(self.directory)
+		git_session.reset()
+		self.environment.stop()
+		shutil.rmtree(self.temp_directory)
+
+	def _assert_rebuilt(self) -> None:
+		"""Ensure an incremental update makes the same changelog as a full rebuild."""
+		make_changelog.make_changelog(prefix = "v", incremental = True)
+		make_changelog.make_changelog(prefix = "v", file_name = "FULL.md")
+		self.assertEqual(_read("CHANGELOG.md"), _read("FULL.md"))
+
+	def test_unchanged(self):
+		"""An up-to-date changelog is not written."""
+		inode = os.stat("CHANGELOG.md").st_ino
+		make_changelog.make_changelog(prefix = "v", incremental = True)
+		self.assertEqual(os.stat("CHANGELOG.md").st_ino, inode)
+
+	def test_new_tag(self):
+		"""Sections for new tags are added to the start."""
+		_git(["tag", "-a", "v2.1.0", "-m", "Release v2.1.0"])
+		self._assert_rebuilt()
+		self.assertIn("## 2.1.0", _read("CHANGELOG.md"))
+
+	def test_newest_tag_changed(self):
+		"""The changelog is rebuilt if its newest section is outdated."""
+		_git(["tag", "-f", "-a", "v2.0.0", "-m", "Changed"])
+		_git(["tag", "-a", "v2.1.0", "-m", "Release v2.1.0"])
+		self._assert_rebuilt()
+		self.assertIn("Changed", _read("CHANGELOG.md"))
+
+	def test_older_tag_changed(self):
+		"""The changelog is rebuilt if an older section is outdated."""
+		_git(["tag", "-f", "-a", "v1.1.0", "-m", "Changed"])
+		_git(["tag", "-a", "v2.1.0", "-m", "Release v2.1.0"])
+		self._assert_rebuilt()
+		self.assertIn("Changed", _read("CHANGELOG.md"))
+
+	def test_tag_added_below(self):
+		"""The changelog is rebuilt if a tag is added below its newest version."""
+		_git(["tag", "-a", "v1.0.1", "-m", "Release v1.0.1"])
+		self._assert_rebuilt()
+		self.assertIn("## 1.0.1", _read("CHANGELOG.md"))
+
+	def test_tag_deleted(self):
+		"""The changelog is rebuilt if a tag was deleted."""
+		_git(["tag", "-d", "v1.0.0"])
+		self._assert_rebuilt()
+		self.assertNotIn("## 1.0.0", _read("CHANGELOG.md"))
+
+class TestCommandLine(unittest.TestCase):
+	"""Test the command-line options."""
+	def test_output_without_file_name(self):
+		"""--output values without a file name are rejected before anything is written."""
+		script = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "make_changelog.py")
+
+		for output in ["CHANGELOG.md", "v="]:
+			with self.subTest(output = output):
+				process = subprocess.run([sys.executable, script, "--output", output], capture_output = True, text = True)
+				self.assertEqual(process.returncode, 2)
+				self.assertIn("PREFIX=FILE", process.stderr)
+
+if __name__ == "__main__":
+	unittest.main()
\ No newline at end of file
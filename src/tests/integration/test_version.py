@@ -0,0 +1,99 @@
+"""
+Test detecting uncommitted changes against a throwaway repository with a submodule.
+
+:usage: `python3 -m unittest discover -s src/tests/integration`.
+"""
+
+import os, shutil, subprocess, sys, tempfile, unittest
+from typing import List
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+import git_session, version
+
+_ENVIRONMENT = {"GIT_AUTHOR_NAME": "Test", "GIT_AUTHOR_EMAIL": "test@example.com", "GIT_COMMITTER_NAME": "Test", "GIT_COMMITTER_EMAIL": "test@example.com"}
+
+def _git(args: List[str]) -> None:
+	"""
+	Run a git command in the current directory.
+
+	:param args: The arguments (without `git`).
+	"""
+	subprocess.run(["git", *args], capture_output = True, check = True)
+
+def _write(path: str, text: str) -> None:
+	"""
+	Write a file.
+
+	:param path: The path of the file.
+	:param text: The contents.
+	"""
+	with open(path, "w") as f:
+		f.write(text)
+
+class TestDirty(unittest.TestCase):
+	"""Test each kind of uncommitted change."""
+	def setUp(self):
+		self.directory = os.getcwd()
+		self.temp_directory = tempfile.mkdtemp()
+		self.environment = mock.patch.dict(os.environ, _ENVIRONMENT)
+		self.environment.start()
+		submodule = os.path.join(self.temp_directory, "submodule")
+		os.makedirs(submodule)
+		os.chdir(submodule)
+		_git(["init", "--quiet"])
+		_git(["commit", "--quiet", "--allow-empty", "-m", "Initial commit"])
+		repo = os.path.join(self.temp_directory, "repo")
+		os.makedirs(repo)
+		os.chdir(repo)
+		_git(["init", "--quiet"])
+		_write(".gitignore", "*.log\n")
+		_write("file.txt", "text\n")
+		_git(["-c", "protocol.file.allow=always", "submodule", "add", "--quiet", submodule, "sub"])
+		_git(["add", "."])
+		_git(["commit", "--quiet", "-m", "Initial commit"])
+
+	def tearDown(self):
+		os.chdir(self.directory)
+		git_session.reset()
+		self.environment.stop()
+		shutil.rmtree(self.temp_directory)
+
+	def _assert_dirty(self, is_dirty: bool) -> None:
+		"""Ensure the version is (or is not) marked dirty, with and without the untracked cache."""
+		for untracked_cache in ["false", "true"]:
+			with self.subTest(untracked_cache = untracked_cache):
+				_git(["config", "core.untrackedCache", untracked_cache])
+				git_session.reset()
+				self.assertEqual(version.get_version().endswith(".dirty"), is_dirty)
+
+	def test_clean(self):
+		"""Ignored files are not changes."""
+		_write("ignored.log", "text\n")
+		self._assert_dirty(False)
+
+	def test_working_tree(self):
+		"""A modified file is a change."""
+		_write("file.txt", "changed\n")
+		self._assert_dirty(True)
+
+	def test_staged_then_reverted(self):
+		"""A staged change is a change even if the working tree matches HEAD again."""
+		_write("file.txt", "changed\n")
+		_git(["add", "file.txt"])
+		_write("file.txt", "text\n")
+		self._assert_dirty(True)
+
+	def test_untracked_directory(self):
+		"""A directory of untracked files is a change."""
+		os.makedirs(os.path.join("new", "nested"))
+		_write(os.path.join("new", "nested", "file.txt"), "text\n")
+		self._assert_dirty(True)
+
+	def test_untracked_in_submodule(self):
+		"""An untracked file in a submodule is a change."""
+		_write(os.path.join("sub", "file.txt"), "text\n")
+		self._assert_dirty(True)
+
+if __name__ == "__main__":
+	unittest.main()
\ No newline at end of file
@@ -0,0 +1,270 @@
+"""
+Record how long external commands and phases of the tools take.
+
+Set the `GIT_TOOLS_TRACE` environment variable to the path of a JSON file to enable tracing. When Python exits, the events are appended to that file in the Chrome trace event format, and a summary sorted by total time is printed to standard error.
+
+The file is a JSON array without its closing bracket, with one event per line (which `chrome://tracing` and https://ui.perfetto.dev accept). Each process appends its events with one write, so processes that exit at the same time do not lose each other's events. Delete the file to start a new trace.
+"""
+
+import atexit, contextlib, json, os, subprocess, sys, threading, time
+from typing import Any, Dict, Iterator, List, Optional
+
+_PATH = os.environ.get("GIT_TOOLS_TRACE") or None
+_LOCK = threading.Lock()
+_EVENTS: List[Dict[str, Any]] = []
+# Convert `time.perf_counter` to wall time (so events from several processes line up)
+_OFFSET = time.time() - time.perf_counter()
+# The number of slowest names to include in the summary
+_SUMMARY_SIZE = 25
+
+def is_enabled() -> bool:
+	"""
+	Return whether tracing is enabled.
+
+	:return: Whether the `GIT_TOOLS_TRACE` environment variable is set.
+	"""
+	return _PATH is not None
+
+def _record(category: str, name: str, start: float, end: float, args: Optional[Dict[str, Any]] = None) -> None:
+	"""
+	Record an event.
+
+	:param category: The category of the event (`command` or `phase`).
+	:param name: The name of the event.
+	:param start: When the event started (from `time.perf_counter`).
+	:param end: When the event ended (from `time.perf_counter`).
+	:param args: Details of the event.
+	"""
+	event = {"name": name, "cat": category, "ph": "X", "ts": round((start + _OFFSET) * 1e6), "dur": round((end - start) * 1e6), "pid": os.getpid(), "tid": threading.get_ident()}
+
+	if args:
+		event["args"] = args
+
+	with _LOCK:
+		_EVENTS.append(event)
+
+def _get_name(args: Any) -> str:
+	"""
+	Return the name of a command (the program and its first argument that is not an option).
+
+	:param args: The command (as passed to `subprocess`).
+	:return: The name.
+	"""
+	if isinstance(args, (str, bytes)):
+		return os.fsdecode(args).split(" ")[0]
+
+	args = [os.fsdecode(arg) for arg in args]
+	name = os.path.basename(args[0]) if args else ""
+	command = next((arg for arg in args[1:] if not arg.startswith("-")), None)
+	return f"{name} {command}" if command else name
+
+def _get_size(output: Any) -> int:
+	"""
+	Return the size of captured output.
+
+	:param output: The output (`None` if it was not captured).
+	:return: The number of characters or bytes.
+	"""
+	return len(output) if output else 0
+
+def run(args: Any, **kwargs) -> subprocess.CompletedProcess:
+	"""
+	Run a command with `subprocess.run`, and record it if tracing is enabled.
+
+	:param args: The command.
+	:param kwargs: Pass these to `subprocess.run`.
+	:return: The completed process.
+	:raise subprocess.CalledProcessError: The command failed (if `check` is `True`).
+	"""
+	if _PATH is None:
+		return subprocess.run(args, **kwargs)
+
+	start = time.perf_counter()
+	details: Dict[str, Any] = {"argv": [os.fsdecode(arg) for arg in args] if isinstance(args, (list, tuple)) else os.fsdecode(args)}
+
+	try:
+		process = subprocess.run(args, **kwargs)
+		details["returncode"] = process.returncode
+		details["output_size"] = _get_size(process.stdout) + _get_size(process.stderr)
+		return process
+	except subprocess.CalledProcessError as e:
+		details["returncode"] = e.returncode
+		details["output_size"] = _get_size(e.stdout) + _get_size(e.stderr)
+		raise
+	finally:
+		_record("command", _get_name(args), start, time.perf_counter(), details)
+
+class _CountingReader(object):
+	"""A pipe from a process that counts what is read from it."""
+	def __init__(self, pipe: Any):
+		self.pipe = pipe
+		self.size = 0
+
+	def __getattr__(self, name: str) -> Any:
+		return getattr(self.pipe, name)
+
+	def __enter__(self) -> "_CountingReader":
+		return self
+
+	def __exit__(self, *args) -> None:
+		self.pipe.close()
+
+	def __iter__(self) -> "_CountingReader":
+		return self
+
+	def __next__(self) -> Any:
+		line = next(self.pipe)
+		self.size += len(line)
+		return line
+
+	def _count(self, data: Any) -> Any:
+		"""
+		Count data that was read.
+
+		:param data: The data.
+		:return: The data.
+		"""
+		self.size += len(data) if data else 0
+		return data
+
+	def read(self, *args) -> Any:
+		return self._count(self.pipe.read(*args))
+
+	def read1(self, *args) -> Any:
+		return self._count(self.pipe.read1(*args))
+
+	def readline(self, *args) -> Any:
+		return self._count(self.pipe.readline(*args))
+
+	def readlines(self, *args) -> List[Any]:
+		lines = self.pipe.readlines(*args)
+		self.size += sum(len(line) for line in lines)
+		return lines
+
+class _TracedPopen(subprocess.Popen):
+	"""A process that is recorded (with the size of the output read from its pipes) when it is first waited for."""
+	def __init__(self, args: Any, **kwargs):
+		self.trace_start = time.perf_counter()
+		self.traced = False
+		super().__init__(args, **kwargs)
+
+		if self.stdout is not None:
+			self.stdout = _CountingReader(self.stdout)
+
+		if self.stderr is not None:
+			self.stderr = _CountingReader(self.stderr)
+
+	def wait(self, timeout: Optional[float] = None) -> int:
+		"""
+		Wait for the process to exit, and record it.
+
+		:param timeout: Wait at most this many seconds.
+		:return: The exit code.
+		:raise subprocess.TimeoutExpired: The process did not exit in time.
+		"""
+		returncode = super().wait(timeout)
+
+		if not self.traced:
+			self.traced = True
+			argv = [os.fsdecode(arg) for arg in self.args] if isinstance(self.args, (list, tuple)) else os.fsdecode(self.args)
+			output_size = sum(pipe.size for pipe in [self.stdout, self.stderr] if isinstance(pipe, _CountingReader))
+			_record("command", _get_name(self.args), self.trace_start, time.perf_counter(), {"argv": argv, "returncode": returncode, "output_size": output_size})
+
+		return returncode
+
+def popen(args: Any, **kwargs) -> subprocess.Popen:
+	"""
+	Start a command with `subprocess.Popen`, and record it (when it is waited for) if tracing is enabled.
+
+	:param args: The command.
+	:param kwargs: Pass these to `subprocess.Popen`.
+	:return: The process.
+	"""
+	if _PATH is None:
+		return subprocess.Popen(args, **kwargs)
+
+	return _TracedPopen(args, **kwargs)
+
+@contextlib.contextmanager
+def phase(name: str) -> Iterator[None]:
+	"""
+	Record how long a phase takes if tracing is enabled (use this as a context manager, or a decorator).
+
+	:param name: The name of the phase.
+	:return: A context manager.
+	"""
+	if _PATH is None:
+		yield
+		return
+
+	start = time.perf_counter()
+
+	try:
+		yield
+	finally:
+		_record("phase", name, start, time.perf_counter())
+
+def _get_summary(events: List[Dict[str, Any]]) -> str:
+	"""
+	Return a summary of events (the total time, and count, of each name).
+
+	:param events: The events.
+	:return: The summary (slowest first).
+	"""
+	totals: Dict[str, List[float]] = {}
+
+	for event in events:
+		total = totals.setdefault(f"{event['cat']}: {event['name']}", [0, 0])
+		total[0] += event["dur"] / 1e6
+		total[1] += 1
+
+	lines = [f"{'total':>9} {'count':>6} name"]
+
+	for name, (seconds, count) in sorted(totals.items(), key = lambda item: -item[1][0])[:_SUMMARY_SIZE]:
+		lines.append(f"{seconds:8.3f}s {count:6} {name}")
+
+	return "\n".join(lines)
+
+def _append(path: str, data: bytes) -> None:
+	"""
+	Append to a trace file, creating it (starting the JSON array) if it is missing.
+
+	:param path: The path of the trace file.
+	:param data: The events (one per line, each followed by a comma).
+	"""
+	try:
+		fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+	except FileNotFoundError:
+		# Link a complete file into place, so no other process can append before the start of the array
+		temp_path = f"{path}.{os.getpid()}.tmp"
+
+		with open(temp_path, "wb") as f:
+			f.write(b"[\n" + data)
+
+		try:
+			os.link(temp_path, path)
+			return
+		except FileExistsError:
+			fd = os.open(path, os.O_WRONLY | os.O_APPEND)
+		finally:
+			os.remove(temp_path)
+
+	try:
+		# One write, so events from processes that exit at the same time are not interleaved
+		os.write(fd, data)
+	finally:
+		os.close(fd)
+
+def _write_trace() -> None:
+	"""Append the recorded events to the trace file, and print a summary."""
+	with _LOCK:
+		events = list(_EVENTS)
+
+	if not events:
+		return
+
+	_append(_PATH, "".join(json.dumps(event) + ",\n" for event in events).encode())
+	print(f"Trace of {' '.join(sys.argv)} ({_PATH}):\n{_get_summary(events)}", file = sys.stderr)
+
+if _PATH is not None:
+	atexit.register(_write_trace)
\ No newline at end of file
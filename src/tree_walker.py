@@ -0,0 +1,82 @@
+"""
+List the files the gitignore settings keep, without listing ignored directories.
+
+:usage: `python3 tree_walker.py --help`.
+"""
+
+import argparse, concurrent.futures, os, sys
+from typing import Iterator, List, Optional, Tuple
+import gitignore_matcher
+
+def _scan(matcher: gitignore_matcher.GitignoreMatcher, root: str, prefix: str) -> Tuple[List[str], List[str]]:
+	"""
+	Scan one directory.
+
+	:param matcher: The matcher for the gitignore file at the root.
+	:param root: The root directory.
+	:param prefix: The path of the directory relative to the root (empty for the root, otherwise ending with "/").
+	:return: The kept files, and the kept subdirectories (relative to the root).
+	"""
+	files = []
+	directories = []
+
+	try:
+		with os.scandir(os.path.join(root, prefix) if prefix else root) as entries:
+			for entry in entries:
+				path = prefix + entry.name
+
+				# Like git, do not follow symbolic links to directories
+				if entry.is_dir(follow_symlinks = False):
+					if entry.name != ".git" and not matcher.is_directory_ignored(path):
+						directories.append(path + "/")
+				elif not matcher.is_ignored(path):
+					files.append(path)
+	except (FileNotFoundError, NotADirectoryError, PermissionError):
+		pass
+
+	return files, directories
+
+def walk_files(root: str = ".", matcher: Optional[gitignore_matcher.GitignoreMatcher] = None, workers: int = 0) -> Iterator[str]:
+	"""
+	Return the files under a directory that the gitignore settings keep (ignored directories, and `.git`, are not scanned).
+
+	:param root: The directory the gitignore file applies to.
+	:param matcher: The matcher to use (compiled from the settings in the current working directory by default).
+	:param workers: Scan this many directories at a time in a thread pool (0 scans one at a time, in sorted order).
+	:return: The paths of the files (relative to the root, using "/").
+	"""
+	if matcher is None:
+		matcher = gitignore_matcher.compile_settings()
+
+	if workers <= 0:
+		pending = [""]
+
+		while pending:
+			files, directories = _scan(matcher, root, pending.pop())
+			yield from sorted(files)
+			pending.extend(sorted(directories, reverse = True))
+
+		return
+
+	with concurrent.futures.ThreadPoolExecutor(max_workers = workers) as executor:
+		running = {executor.submit(_scan, matcher, root, "")}
+
+		while running:
+			done, _ = concurrent.futures.wait(running, return_when = concurrent.futures.FIRST_COMPLETED)
+			# Only wait for the scans that have not finished
+			running -= done
+
+			for future in done:
+				files, directories = future.result()
+				running.update(executor.submit(_scan, matcher, root, directory) for directory in directories)
+				yield from files
+
+if __name__ == "__main__":
+	_PARSER = argparse.ArgumentParser()
+	_PARSER.add_argument("--root", default = ".", help = "the directory to list")
+	_PARSER.add_argument("--workers", type = int, default = 0, help = "scan this many directories at a time")
+	_PARSER.add_argument("-z", dest = "separator", action = "store_const", const = "\0", default = "\n", help = "separate paths with NUL bytes")
+	_ARGS = _PARSER.parse_args()
+
+	for _PATH in walk_files(_ARGS.root, workers = _ARGS.workers):
+		sys.stdout.write(_PATH + _ARGS.separator)
\ No newline at end of file
@@ -4,20 +4,230 @@ Get the version of the current commit.
 :usage: `python3 version.py --help`.
 """
 
-import argparse, re, subprocess, sys
-from typing import Optional
-import checks
+import argparse, hashlib, json, os, re, subprocess, sys
+from typing import Dict, Iterator, List, Optional, Tuple
+import checks, files, git_session, tracing
 
 # Regex from https://semver.org#is-there-a-suggested-regular-expression-regex-to-check-a-semver-string
 SEMVER_REGEX = r"^(?P<major>0|[1-9]\d*)\.(?P<minor>0|[1-9]\d*)\.(?P<patch>0|[1-9]\d*)(?:-(?P<prerelease>(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*)(?:\.(?:0|[1-9]\d*|\d*[a-zA-Z-][0-9a-zA-Z-]*))*))?(?:\+(?P<buildmetadata>[0-9a-zA-Z-]+(?:\.[0-9a-zA-Z-]+)*))?$"
+SEMVER_PATTERN = re.compile(SEMVER_REGEX)
+_CACHE_NAME = "version-cache.json"
+# The most commits to remember versions for (the oldest entries are removed first)
+_CACHE_SIZE = 1000
 
-def get_version(prefix: Optional[str] = None, semver: bool = False, default: str = "0.0.0") -> str:
+def _get_tags_fingerprint() -> Optional[str]:
+	"""
+	Return a fingerprint of the repository's tags (from the stat data of the loose tag files and `packed-refs`, without reading them).
+
+	Git replaces ref files by renaming new ones over them, so a changed tag has a new inode and modification time.
+
+	:return: The fingerprint, or `None` if tags are not stored in files.
+	"""
+	if os.path.exists(git_session.get_common_path("reftable")):
+		return None
+
+	digest = hashlib.sha256()
+	tags_path = git_session.get_common_path(os.path.join("refs", "tags"))
+	paths = [git_session.get_common_path("packed-refs")]
+
+	for directory, directory_names, file_names in os.walk(tags_path):
+		directory_names.sort()
+		paths.extend(os.path.join(directory, name) for name in sorted(file_names))
+
+	for path in paths:
+		try:
+			stat = os.stat(path)
+			digest.update(f"{os.path.relpath(path, tags_path)}\0{stat.st_ino} {stat.st_size} {stat.st_mtime_ns}\0".encode())
+		except FileNotFoundError:
+			pass
+
+	return digest.hexdigest()
+
+def _get_tag(prefix: str) -> Tuple[Optional[str], bool]:
+	"""
+	Return the highest version tag merged into HEAD, and whether it points at HEAD.
+
+	:param prefix: Only consider tags with this prefix.
+	:return: The tag (`None` if there is none), and whether HEAD is its release commit.
+	:raise subprocess.CalledProcessError: Failed to get tags.
+	"""
+	version = next(iter(git_session.get_merged_tags(prefix)), None)
+
+	if not version:
+		return None, False
+
+	current_commit_version = git_session.run(["tag", "--sort=-version:refname", "--points-at", "HEAD", "--merged"]).stdout.split("\n")[0].strip()
+	return version, version == current_commit_version
+
+@tracing.phase("version.get_tag")
+def _get_cached_tag(prefix: str, head: str, refresh: bool) -> Tuple[Optional[str], bool]:
+	"""
+	Return the result of `_get_tag`, using the version cache in the git directory.
+
+	:param prefix: Only consider tags with this prefix.
+	:param head: The object name of HEAD.
+	:param refresh: Ignore the cached result (and replace it).
+	:return: The tag (`None` if there is none), and whether HEAD is its release commit.
+	:raise subprocess.CalledProcessError: Failed to get tags.
+	"""
+	fingerprint = _get_tags_fingerprint()
+
+	if fingerprint is None:
+		return _get_tag(prefix)
+
+	cache_path = git_session.get_git_path(_CACHE_NAME)
+	cache = files.read_json(cache_path, {})
+	# Results for different tags are stale
+	versions = cache.get("versions", {}) if cache.get("tags") == fingerprint else {}
+	key = f"{head} {prefix}"
+
+	if not refresh and key in versions:
+		version, is_release_commit = versions[key]
+		return version, is_release_commit
+
+	version, is_release_commit = _get_tag(prefix)
+	versions.pop(key, None)
+	versions[key] = [version, is_release_commit]
+
+	for old_key in list(versions)[:max(len(versions) - _CACHE_SIZE, 0)]:
+		del versions[old_key]
+
+	files.write_json(cache_path, {"tags": fingerprint, "versions": versions})
+	return version, is_release_commit
+
+def _has_output(args: List[str]) -> bool:
+	"""
+	Return whether a git command prints anything (stop it at the first byte).
+
+	:param args: The arguments (without `git`).
+	:return: Whether it printed anything.
+	:raise subprocess.CalledProcessError: The command failed before printing anything.
+	"""
+	process = git_session.popen(args, stdout = subprocess.PIPE)
+	has_output = bool(process.stdout.read(1))
+
+	if has_output:
+		process.kill()
+
+	process.stdout.close()
+
+	if process.wait() != 0 and not has_output:
+		raise subprocess.CalledProcessError(process.returncode, process.args)
+
+	return has_output
+
+def _has_untracked_files() -> bool:
+	"""
+	Return whether there are untracked files that are not ignored (stop at the first one).
+
+	:return: Whether there are untracked files.
+	:raise subprocess.CalledProcessError: Failed to list untracked files.
+	"""
+	config = git_session.run(["config", "--get-regexp", r"^core\.(untrackedcache|fsmonitor)$"], check = False).stdout.split("\n")
+
+	# Only git status uses the untracked cache and fsmonitor (tracked files are known to be unchanged here)
+	if any(line.split(" ", 1)[-1].lower() not in ["", "false", "no", "off", "0"] for line in config):
+		return _has_output(["status", "--porcelain", "--untracked-files=normal", "--ignore-submodules=all", "-z"])
+
+	# Untracked directories are listed without their contents
+	return _has_output(["ls-files", "--others", "--exclude-standard", "--directory", "--no-empty-directory", "-z"])
+
+def _has_submodule_changes() -> bool:
+	"""
+	Return whether submodules have untracked files (`git diff` and `git ls-files` do not look inside submodules for them).
+
+	:return: Whether a submodule has untracked files that are not ignored.
+	:raise subprocess.CalledProcessError: Failed to check the submodules.
+	"""
+	if not os.path.isfile(".gitmodules"):
+		return False
+
+	config = git_session.run(["config", "--file", ".gitmodules", "--get-regexp", r"^submodule\..*\.path$"], check = False).stdout.splitlines()
+	paths = [line.split(" ", 1)[1] for line in config if " " in line]
+
+	if not paths:
+		return False
+
+	# Only status checks submodules for untracked files (limit it to the submodules)
+	return _has_output(["--literal-pathspecs", "status", "--porcelain", "--untracked-files=normal", "-z", "--", *paths])
+
+def _differs_from_head(args: List[str]) -> bool:
+	"""
+	Return whether `git diff --quiet` finds differences from HEAD.
+
+	:param args: The arguments between `diff --quiet` and `HEAD`.
+	:return: Whether there are differences.
+	:raise subprocess.CalledProcessError: Failed to compare.
+	"""
+	args = ["diff", "--quiet", *args, "HEAD", "--"]
+	# Exits with 1 if there are differences
+	returncode = git_session.run(args, check = False, capture_output = False).returncode
+
+	if returncode not in [0, 1]:
+		raise subprocess.CalledProcessError(returncode, ["git", *args])
+
+	return returncode == 1
+
+@tracing.phase("version.is_dirty")
+def _is_dirty(head: Optional[str]) -> bool:
+	"""
+	Return whether there are uncommitted changes (check tracked files first, and stop at the first change).
+
+	:param head: The object name of HEAD (`None` if there are no commits).
+	:return: Whether there are changes, or untracked files that are not ignored (including in submodules).
+	:raise subprocess.CalledProcessError: Failed to check for changes.
+	"""
+	if head is None:
+		return bool(git_session.run(["status", "--porcelain"]).stdout.strip())
+
+	# Compare the working tree with HEAD, then the index (a staged change can be reverted in the working tree)
+	return _differs_from_head([]) or _differs_from_head(["--cached"]) or _has_untracked_files() or _has_submodule_changes()
+
+def _format_version(version: Optional[str], is_release_commit: bool, commit: Optional[str], is_dirty: bool, prefix: str, semver: bool, default: str) -> str:
+	"""
+	Return the version string for a commit.
+
+	:param version: The highest version tag merged into the commit (`None` if there is none).
+	:param is_release_commit: Whether the tag points at the commit.
+	:param commit: The object name of the commit (`None` if there are no commits).
+	:param is_dirty: Whether there are uncommitted changes.
+	:param prefix: The prefix of version tags.
+	:param semver: Ensure the returned string is a Semantic Versioning 2.0 compliant string.
+	:param default: Use this version if there is no version.
+	:return: The version (see `get_version`).
+	:raise Exception: The version is not a Semantic Versioning 2.0 version (if `semver` is `True`).
+	"""
+	if not version:
+		version = f"{prefix}{default}"
+		is_release_commit = False
+
+	version = version.lstrip(prefix)
+
+	if is_dirty or not is_release_commit:
+		metadata = []
+
+		if commit and not is_release_commit:
+			metadata.append(f"commit-{commit}")
+
+		if is_dirty:
+			metadata.append("dirty")
+
+		version += "+" + ".".join(metadata)
+
+	if semver and not SEMVER_PATTERN.match(version):
+		raise Exception(f"{version} is not a valid Semantic Versioning 2.0 string")
+
+	return version
+
+@tracing.phase("version.get_version")
+def get_version(prefix: Optional[str] = None, semver: bool = False, default: str = "0.0.0", refresh: bool = False) -> str:
 	"""
 	Return the version of the current commit using git tags.
 
 	:param prefix: Only consider tags with this prefix, and remove the prefix to get the version number.
 	:param semver: Ensure the returned string is a Semantic Versioning 2.0 compliant string.
 	:param default: Use this version if there is no version.
+	:param refresh: Find the version tag again instead of using the version cache in the git directory (the cache is keyed by HEAD and the tags, so this is only needed if history was replaced).
 	:return: The version of the current commit. Include the full commit hash as metadata if it is not a release. Include a dirty indicator as metadata if there are uncommitted changes. For example, `1.0.0-beta.1+commit-5e94edf0845f6693683ab4e90b572d3a2967af1e.dirty`.
 	:raise Exception: The version is not a Semantic Versioning 2.0 version (if `semver` is `True`).
 	:raise subprocess.CalledProcessError: Failed to get tags, or a different shell command failed.
@@ -35,43 +245,96 @@ def get_version(prefix: Optional[str] = None, semver: bool = False, default: str
 	if prefix is None:
 		prefix = ""
 
+	head = git_session.read_head() if branch_exists else None
+
 	if branch_exists:
-		version = subprocess.run(["git", "tag", "--sort=-version:refname", "--list", f"{prefix}*", "--merged"], capture_output = True, check = True, text = True).stdout.split("\n")[0].strip()
+		version, is_release_commit = _get_cached_tag(prefix, head, refresh) if head else _get_tag(prefix)
 	else:
-		version = None
+		version, is_release_commit = None, False
 
-	if version:
-		current_commit_version = subprocess.run(["git", "tag", "--sort=-version:refname", "--points-at", "HEAD", "--merged"], capture_output = True, check = True, text = True).stdout.split("\n")[0].strip()
-		is_release_commit = version == current_commit_version
-	else:
-		version = f"{prefix}{default}"
-		is_release_commit = False
+	return _format_version(version, is_release_commit, head, _is_dirty(head), prefix, semver, default)
 
-	version = version.lstrip(prefix)
+def _read_tag_map() -> Tuple[Dict[str, List[int]], List[str]]:
+	"""
+	Return the commits all tags point at, ranked by version (from one `git for-each-ref` call).
 
-	git_status = subprocess.run(["git", "status", "--porcelain"], capture_output = True, check = True, text = True).stdout.strip()
-	is_dirty = bool(git_status)
+	:return: The ranks of the tags at each commit (lowest first), and the names of the tags by rank (highest version first).
+	:raise subprocess.CalledProcessError: Failed to get tags.
+	"""
+	tag_map: Dict[str, List[int]] = {}
+	names = []
 
-	if is_dirty or not is_release_commit:
-		metadata = []
+	for line in git_session.run(["for-each-ref", "--sort=-version:refname", "--format=%(objectname) %(*objectname) %(refname:strip=2)", "refs/tags/"]).stdout.splitlines():
+		object_name, commit, name = line.split(" ", 2)
+		# Annotated tags point at tag objects (use the commits they point at)
+		tag_map.setdefault(commit or object_name, []).append(len(names))
+		names.append(name)
 
-		if branch_exists and not is_release_commit:
-			current_commit_hash = subprocess.run(["git", "rev-parse", "--verify", "HEAD"], capture_output = True, check = True, text = True).stdout.strip()
-			metadata.append(f"commit-{current_commit_hash}")
+	return tag_map, names
 
-		if is_dirty:
-			metadata.append("dirty")
+def get_versions(rev_range: str, prefix: Optional[str] = None, semver: bool = False, default: str = "0.0.0") -> Iterator[Tuple[str, str]]:
+	"""
+	Return the versions of every commit in a range using git tags, walking the history once (the rules of `get_version` apply, but commits are never dirty).
 
-		version += "+" + ".".join(metadata)
+	:param rev_range: The range of commits (for example, `v1.0.0..HEAD`, or a branch for all of its history).
+	:param prefix: Only consider tags with this prefix, and remove the prefix to get the version number.
+	:param semver: Ensure the returned strings are Semantic Versioning 2.0 compliant strings.
+	:param default: Use this version if there is no version.
+	:return: The object name and version of each commit (parents before children).
+	:raise Exception: A version is not a Semantic Versioning 2.0 version (if `semver` is `True`).
+	:raise subprocess.CalledProcessError: Failed to get tags, or to walk the history.
+	:raise AssertionError: The current working directory is not the root of a git repository.
+	"""
+	checks.assert_is_root()
 
-	if semver and not re.match(SEMVER_REGEX, version):
-		raise Exception(f"{version} is not a valid Semantic Versioning 2.0 string")
+	if prefix is None:
+		prefix = ""
 
-	return version
+	tag_map, names = _read_tag_map()
+	ranks = {name: rank for rank, name in enumerate(names)}
+	# The rank of the highest version tag merged into each commit (None if there is none)
+	best: Dict[str, Optional[int]] = {}
+	process = git_session.popen(["rev-list", "--topo-order", "--reverse", "--parents", rev_range, "--"], stdout = subprocess.PIPE, text = True)
+	finished = False
+
+	try:
+		for line in process.stdout:
+			commit, *parents = line.split()
+
+			for parent in parents:
+				# Parents outside the range
+				if parent not in best:
+					merged_tags = git_session.get_merged_tags(prefix, parent)
+					best[parent] = ranks[merged_tags[0]] if merged_tags else None
+
+			tags_at_commit = tag_map.get(commit, [])
+			candidates = [best[parent] for parent in parents if best[parent] is not None] + [rank for rank in tags_at_commit if names[rank].startswith(prefix)]
+			best[commit] = min(candidates) if candidates else None
+			version = None if best[commit] is None else names[best[commit]]
+			# Like `git tag --points-at`, the highest tag at the commit must be the version tag
+			is_release_commit = bool(tags_at_commit) and version == names[tags_at_commit[0]]
+			yield commit, _format_version(version, is_release_commit, commit, False, prefix, semver, default)
+
+		finished = True
+	finally:
+		if not finished:
+			process.kill()
+
+		process.stdout.close()
+
+		if process.wait() != 0 and finished:
+			raise subprocess.CalledProcessError(process.returncode, process.args)
 
 if __name__ == "__main__":
 	_PARSER = argparse.ArgumentParser()
 	_PARSER.add_argument("--prefix", default = None, help = "the prefix version tags have")
 	_PARSER.add_argument("--semver", action = "store_true", help = "enforce Semantic Versioning 2.0")
+	_PARSER.add_argument("--refresh", action = "store_true", help = "find the version tag again instead of using the cache")
+	_PARSER.add_argument("--range", default = None, help = "print the version of every commit in this range (as JSON lines)")
 	_ARGS = _PARSER.parse_args()
-	print(get_version(prefix = _ARGS.prefix, semver = _ARGS.semver))
\ No newline at end of file
+
+	if _ARGS.range is None:
+		print(get_version(prefix = _ARGS.prefix, semver = _ARGS.semver, refresh = _ARGS.refresh))
+	else:
+		for _COMMIT, _VERSION in get_versions(_ARGS.range, prefix = _ARGS.prefix, semver = _ARGS.semver):
+			print(json.dumps({"commit": _COMMIT, "version": _VERSION}), flush = True)
\ No newline at end of file